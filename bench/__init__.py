@@ -0,0 +1,2 @@
+from corpus import *
+from suite import *
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+
+from cpk.crilayla import COMPRESS_PRESETS
+from corpus import Corpus, CORPUS_FILES, CORPUS_MEDIAN, CORPUS_SIGMA, CORPUS_RATIO
+from suite import run, BENCH_REPEAT
+
+if __name__ == '__main__':
+
+    import argparse
+    from sys import stderr, stdout
+
+    parser = argparse.ArgumentParser(prog='python -m bench',
+            description='Benchmark cpk against a synthetic archive')
+    parser.add_argument('-n', '--files',
+            default=CORPUS_FILES, dest='files', type=int,
+            help='Number of files (default %d)' % CORPUS_FILES)
+    parser.add_argument('--median',
+            default=CORPUS_MEDIAN, dest='median', type=int,
+            help='Median file size in bytes (default %d)' % CORPUS_MEDIAN)
+    parser.add_argument('--sigma',
+            default=CORPUS_SIGMA, dest='sigma', type=float,
+            help='Spread of log-normal file sizes (default %.1f)' % CORPUS_SIGMA)
+    parser.add_argument('--ratio',
+            default=CORPUS_RATIO, dest='ratio', type=float,
+            help='Compressible part of file content, 0 to 1 (default %.1f)' % CORPUS_RATIO)
+    parser.add_argument('-c', '--compress',
+            default='greedy', dest='preset', choices=sorted(COMPRESS_PRESETS),
+            help='Compress files with CRILAYLA when smaller (default "greedy")')
+    parser.add_argument('-e', '--encrypt', dest='encrypted', action='store_true',
+            help='Encrypt @UTF tables')
+    parser.add_argument('-s', '--seed',
+            default=0, dest='seed', type=int,
+            help='Seed of file sizes and content (default 0)')
+    parser.add_argument('-r', '--repeat',
+            default=BENCH_REPEAT, dest='repeat', type=int,
+            help='Runs of each stage, the best is reported (default %d)' % BENCH_REPEAT)
+    parser.add_argument('-j', '--jobs',
+            default=0, dest='jobs', type=int,
+            help='Compress files with N worker processes')
+    parser.add_argument('-o', '--output',
+            default=None, dest='output',
+            help='Write JSON report to file instead of stdout')
+    parser.add_argument('-k', '--keep',
+            default=None, dest='keep',
+            help='Work in this directory and keep corpus and archive')
+    args = parser.parse_args()
+
+    work = args.keep or tempfile.mkdtemp(prefix='cpkbench')
+
+    try:
+        corpus = Corpus(os.path.join(work, 'corpus'), args.files, args.median, args.sigma,
+                args.ratio, args.encrypted, args.preset, args.seed)
+
+        path = os.path.join(work, 'corpus.cpk')
+
+        print >>stderr, "Generate %d files..." % args.files
+        size = corpus.generate()
+
+        print >>stderr, "Pack %s..." % path
+        stored = corpus.pack(path, args.jobs)
+
+        print >>stderr, "Benchmark..."
+        report = {
+            'corpus'    : dict(corpus.params(), bytes=size, archive=stored),
+            'results'   : run(corpus, path, os.path.join(work, 'output'), args.repeat),
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(work)
+
+    out = open(args.output, 'w') if args.output else stdout
+    json.dump(report, out, indent=2, sort_keys=True)
+    out.write('\n')
@@ -0,0 +1,120 @@
+from math import log
+import os
+import random
+
+from cpk.packer import Packer
+
+# Words of compressible content, repeated within the CRILAYLA window
+CORPUS_WORDS = [
+    'alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel',
+    'india', 'juliet', 'kilo', 'lima', 'mike', 'november', 'oscar', 'papa',
+]
+
+# Size of a chunk of noise, compressibility is decided per chunk
+CORPUS_CHUNK = 0x40
+
+# Default corpus, file sizes follow a log-normal distribution
+CORPUS_FILES = 200
+CORPUS_MEDIAN = 0x4000
+CORPUS_SIGMA = 1.0
+CORPUS_RATIO = 0.5
+CORPUS_DIRS = 8
+
+# Bounds of a file size, the lower one keeps data off the padding lines
+CORPUS_SIZE_MIN = 0x10
+CORPUS_SIZE_MAX = 0x1000000
+
+def randombytes(rnd, n):
+
+    """`n' random bytes drawn from `rnd'"""
+
+    if not n:
+        return ''
+
+    return ('%0*x' % (2 * n, rnd.getrandbits(8 * n))).decode('hex')
+
+def content(rnd, size, ratio):
+
+    """`size' bytes, about `ratio' of which is text and the rest is noise"""
+
+    chunks = []
+    n = 0
+
+    while n < size:
+        if rnd.random() < ratio:
+            chunk = ' '.join(rnd.choice(CORPUS_WORDS) for i in xrange(8)) + '\n'
+        else:
+            chunk = randombytes(rnd, CORPUS_CHUNK)
+        chunks.append(chunk)
+        n += len(chunk)
+
+    return ''.join(chunks)[:size]
+
+class Corpus(object):
+
+    """
+    Reproducible synthetic CPK archive
+
+    Files of `files' count are written under `root' with sizes drawn around
+    `median' bytes (log-normal, `sigma' spread) and `ratio' of compressible
+    content, then packed with Packer. The same `seed' makes the same files.
+    """
+
+    def __init__(s, root, files=CORPUS_FILES, median=CORPUS_MEDIAN, sigma=CORPUS_SIGMA,
+            ratio=CORPUS_RATIO, encrypted=False, preset=None, seed=0):
+
+        (s.root, s.files, s.median, s.sigma) = (root, files, median, sigma)
+        (s.ratio, s.encrypted, s.preset, s.seed) = (ratio, encrypted, preset, seed)
+
+        s.sizes = []
+
+    def params(s):
+
+        """Parameters of corpus as a dict"""
+
+        return {
+            'files'     : s.files,
+            'median'    : s.median,
+            'sigma'     : s.sigma,
+            'ratio'     : s.ratio,
+            'encrypted' : s.encrypted,
+            'preset'    : s.preset,
+            'seed'      : s.seed,
+        }
+
+    def generate(s):
+
+        """Write files under root, return total size"""
+
+        rnd = random.Random(s.seed)
+
+        s.sizes = []
+
+        for i in xrange(s.files):
+            size = int(rnd.lognormvariate(log(s.median), s.sigma))
+            size = min(max(size, CORPUS_SIZE_MIN), CORPUS_SIZE_MAX)
+
+            top = os.path.join(s.root, 'dir%02d' % (i % CORPUS_DIRS))
+            if not os.path.isdir(top):
+                os.makedirs(top)
+
+            with open(os.path.join(top, 'file%05d.bin' % i), 'wb') as f:
+                f.write(content(rnd, size, s.ratio))
+
+            s.sizes.append(size)
+
+        return sum(s.sizes)
+
+    def pack(s, path, jobs=0):
+
+        """Generate files if not yet and pack them to `path'"""
+
+        if not s.sizes:
+            s.generate()
+
+        packer = Packer(s.root, None, s.preset, s.encrypted)
+
+        with open(path, 'wb') as f:
+            packer.pack(f, jobs)
+
+        return os.path.getsize(path)
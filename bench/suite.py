@@ -0,0 +1,147 @@
+from argparse import Namespace
+from cStringIO import StringIO
+from mmap import mmap, ACCESS_READ
+from struct import unpack
+from timeit import default_timer
+import os
+import random
+
+from cpk.archive import Archive, cell
+from cpk.chiper import crypt
+from cpk.crilayla import deflate_crilayla
+from cpk.fragment import FRAGMENT_TOC
+from cpk.index import Entry
+from cpk.utf import UTFTable
+from corpus import randombytes
+
+# Default number of runs, the best one is reported
+BENCH_REPEAT = 3
+
+# Bytes run through the chiper
+BENCH_CHIPER_SIZE = 4 << 20
+
+def measure(func, repeat=BENCH_REPEAT):
+
+    """Best wall time of `repeat' calls of `func', with result of the last call"""
+
+    best = None
+
+    for i in xrange(repeat):
+        start = default_timer()
+        result = func()
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return (best, result)
+
+def rate(seconds, size, count):
+
+    """Throughput in MB/s and latency in microseconds per entry as a dict"""
+
+    return {
+        'seconds'   : seconds,
+        'bytes'     : size,
+        'entries'   : count,
+        'mb_per_s'  : size / seconds / (1 << 20) if seconds else None,
+        'entry_us'  : seconds * 1e6 / count if count else None,
+    }
+
+def scan(path):
+
+    """Scan frames of `path' as cpkunpack does without TOC, return number of frames"""
+
+    import cpkunpack
+
+    # The scanner looks its options and tables up in globals of cpkunpack
+    cpkunpack.args = Namespace(do_extract_as_raw=True)
+    cpkunpack.lib = cpkunpack.TableLibrary()
+
+    frames = 0
+
+    with open(path, 'rb') as f:
+        m = mmap(f.fileno(), 0, access=ACCESS_READ)
+        for frame in cpkunpack.readframe(m):
+            if frame.typename in [cpkunpack.FRAME_CPK, cpkunpack.FRAME_TOC,
+                    cpkunpack.FRAME_ITOC, cpkunpack.FRAME_ETOC]:
+                frame.utf = cpkunpack.UTF(frame.data[0])
+                cpkunpack.lib[frame.typename] = frame
+            frames += 1
+        m.close()
+
+    return frames
+
+def extract(path, root):
+
+    """Extract every entry of `path' under `root' based on TOC, return total size"""
+
+    size = 0
+
+    with open(path, 'rb') as f:
+        archive = Archive(f)
+        for entry in archive:
+            local = os.path.join(root, entry.DirName, entry.FileName)
+            if not os.path.isdir(os.path.dirname(local)):
+                os.makedirs(os.path.dirname(local))
+            with open(local, 'wb') as out:
+                archive.extract(entry, out)
+            size += entry.ExtractSize
+
+    return size
+
+def run(corpus, path, root, repeat=BENCH_REPEAT):
+
+    """Time every stage against archive `path' of `corpus', extracting under `root'"""
+
+    import cpkunpack
+
+    results = {}
+
+    size = os.path.getsize(path)
+
+    with open(path, 'rb') as f:
+        archive = Archive(f)
+        entries = list(archive)
+        toc = str(archive.fragments[FRAGMENT_TOC].data)
+        frames = [archive.readraw(e) for e in entries if cell(e, 'FileSize') != cell(e, 'ExtractSize')]
+
+    (seconds, count) = measure(lambda: scan(path), repeat)
+    results['readframe'] = rate(seconds, size, count)
+
+    # Rows are built on access, every row is decoded to time the whole table
+    (seconds, _) = measure(lambda: list(cpkunpack.UTF(toc).rows), repeat)
+    results['UTF'] = rate(seconds, len(toc), len(entries))
+
+    (seconds, _) = measure(lambda: UTFTable.parse(StringIO(toc)).rows, repeat)
+    results['UTFTable.parse'] = rate(seconds, len(toc), len(entries))
+
+    # Columns of TOC read by Archive, without building rows
+    def columns():
+        t = UTFTable.parse(StringIO(toc))
+        return [t.column(key) for key in Entry._fields[:-1]]
+
+    (seconds, _) = measure(columns, repeat)
+    results['UTFTable.column'] = rate(seconds, len(toc), len(entries))
+
+    # Only the bitstream is timed, without the raw header and checks of uncompress
+    streams = []
+    for data in frames:
+        (_, usize, datasize) = unpack('<8sLL', data[:0x10])
+        streams.append((data[0x10:0x10 + datasize], usize))
+
+    def deflate():
+        for data, usize in streams:
+            deflate_crilayla(data, usize)
+
+    (seconds, _) = measure(deflate, repeat)
+    results['deflate_crilayla'] = rate(seconds, sum(usize for _, usize in streams), len(streams))
+
+    data = randombytes(random.Random(corpus.seed), BENCH_CHIPER_SIZE)
+
+    (seconds, _) = measure(lambda: crypt(data), repeat)
+    results['chiper'] = rate(seconds, len(data), 0)
+
+    (seconds, total) = measure(lambda: extract(path, root), repeat)
+    results['extract'] = rate(seconds, total, len(entries))
+
+    return results
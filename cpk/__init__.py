@@ -1,5 +1,13 @@
 
+from chiper import *
 from utf import *
 from fragment import *
 from crilayla import *
-
+from index import *
+from cache import *
+from metrics import *
+from archive import *
+from selector import *
+from packer import *
+from patcher import *
+from verify import *
@@ -0,0 +1,395 @@
+
+from cStringIO import StringIO
+from posixpath import join, normpath, dirname, basename
+from mmap import mmap, ACCESS_READ
+from collections import namedtuple
+from functools import partial
+from itertools import izip
+from operator import attrgetter
+from io import RawIOBase, SEEK_SET, SEEK_CUR, SEEK_END
+import errno
+import os
+
+from utf import UTFTable
+from fragment import Fragment, FRAGMENT_CPK, FRAGMENT_TOC, FRAGMENT_ITOC, FRAGMENT_ETOC
+from crilayla import uncompress
+from transfer import copyrange
+from index import Entry, loadindex, saveindex
+
+# Tables located by offset columns of CPK header
+ARCHIVE_TABLES = [
+    (FRAGMENT_TOC  , 'TocOffset'),
+    (FRAGMENT_ITOC , 'ItocOffset'),
+    (FRAGMENT_ETOC , 'EtocOffset'),
+]
+
+# Result of Archive.stat, `stored' is FileSize and `size' is ExtractSize
+Stat = namedtuple('Stat', ['path', 'isdir', 'size', 'stored', 'offset', 'ID'])
+
+def normalize(path):
+
+    """Normalize a path in archive, the root is ''"""
+
+    path = normpath(path).strip('/')
+
+    return '' if path == '.' else path
+
+def cell(row, key):
+
+    """Get value of a @UTF Table cell, None if the column is missing or empty"""
+
+    try:
+        val = getattr(row, key)
+    except AttributeError:
+        return None
+
+    if tuple == type(val):
+        return val[0] if len(val) else None
+
+    return val
+
+class Archive(object):
+
+    """
+    Random access reader of CPK archive
+
+    Only the CPK header and the tables it points to are read on creation,
+    a file entry is read by seeking straight to its offset in TOC.
+
+    With `index', TOC entries are kept in a sidecar file next to the archive
+    so that tables are only parsed when the archive changed.
+
+    With `cache', an EntryCache shared by any number of archives, uncompressed
+    CRILAYLA entries are kept in memory for repeated reads.
+    """
+
+    def __init__(s, f, index=False, cache=None):
+
+        s.f = f
+        s.cache = cache
+
+        # Same file opened twice shares cached entries
+        try:
+            st = os.fstat(f.fileno())
+            s.identity = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+        except (AttributeError, IOError, OSError):
+            s.identity = id(s)
+
+        s.fragments = {}
+        s.tables = {}
+
+        s.load(FRAGMENT_CPK, 0)
+
+        s.header = s.table(FRAGMENT_CPK).rows[0]
+
+        for special, key in ARCHIVE_TABLES:
+            offset = cell(s.header, key)
+            if offset:
+                s.load(special, offset)
+
+        # FileOffset in TOC is relative to the lower of content and TOC
+        s.baseline = min(filter(lambda x: x is not None, [
+            cell(s.header, 'ContentOffset'),
+            cell(s.header, 'TocOffset'),
+        ]))
+
+        header = s.fragments[FRAGMENT_CPK].data
+
+        cached = loadindex(f, header) if index else None
+
+        if cached:
+            (s.entries, paths) = cached
+        else:
+            # Entries are taken from TOC by column, rows are never built
+            toc = s.toc
+            columns = [toc.column(key) for key in Entry._fields[:-1]]
+            columns.append(xrange(len(toc)))
+
+            s.entries = sorted(map(partial(tuple.__new__, Entry), izip(*columns)), key=attrgetter('FileOffset'))
+
+            paths = [join(e.DirName or '', e.FileName) for e in s.entries]
+
+            if index:
+                saveindex(f, header, s.entries, paths)
+
+        s._map_path = dict(zip(paths, s.entries))
+
+    def load(s, special, offset):
+
+        """Read fragment of `special' table at `offset'"""
+
+        fragment = s.fragment(offset)
+
+        if fragment.special != special:
+            raise Exception("Expect %s fragment at 0x%x" % (special, offset))
+
+        s.fragments[special] = fragment
+
+    def table(s, special):
+
+        """Get @UTF Table of a fragment, parsed on first access"""
+
+        if not s.tables.has_key(special):
+            s.tables[special] = UTFTable.parse(StringIO(s.fragments[special].data))
+
+        return s.tables[special]
+
+    @property
+    def toc(s):
+
+        return s.table(FRAGMENT_TOC)
+
+    def fragment(s, offset):
+
+        return Fragment.special(s.f, offset)
+
+    def offset(s, entry):
+
+        return s.baseline + cell(entry, 'FileOffset')
+
+    def path(s, entry):
+
+        return join(cell(entry, 'DirName') or '', cell(entry, 'FileName'))
+
+    def find(s, path):
+
+        """Find TOC entry by path, raise KeyError if not found"""
+
+        return s._map_path[path]
+
+    def pread(s, offset, size):
+
+        """Read `size' bytes at `offset' of archive"""
+
+        s.f.seek(offset)
+
+        return s.f.read(size)
+
+    def readraw(s, entry):
+
+        """Read data of an entry as stored in archive"""
+
+        return s.pread(s.offset(entry), cell(entry, 'FileSize'))
+
+    def read(s, entry):
+
+        """Read data of an entry, CRILAYLA compressed data is uncompressed"""
+
+        data = s.readraw(entry)
+
+        (file_size, extract_size) = (cell(entry, 'FileSize'), cell(entry, 'ExtractSize'))
+
+        if data[:8] == 'CRILAYLA':
+            if s.cache is not None:
+                return s.cache.fetch((s.identity, entry.TocIndex),
+                        lambda: uncompress(data, None, extract_size, file_size))
+            return uncompress(data, None, extract_size, file_size)
+
+        assert file_size == extract_size
+
+        return data
+
+    def extract(s, entry, f):
+
+        """Write data of an entry to file `f', raw data is copied by kernel if possible"""
+
+        s.f.seek(s.offset(entry))
+
+        # Peek within the entry, an empty entry shares its offset with the next
+        if s.f.read(min(8, cell(entry, 'FileSize'))) == 'CRILAYLA':
+            return f.write(s.read(entry))
+
+        assert cell(entry, 'FileSize') == cell(entry, 'ExtractSize')
+
+        return copyrange(s.f, f, s.offset(entry), cell(entry, 'ExtractSize'))
+
+    def open(s, path):
+
+        """Open an entry as a read-only file object, raise IOError if not found"""
+
+        try:
+            entry = s.find(normalize(path))
+        except KeyError:
+            raise IOError(errno.ENOENT, "No such file in archive", path)
+
+        return ArchiveFile(s, entry)
+
+    def directories(s):
+
+        """Map directory path to names of its files and subdirectories, built on first use"""
+
+        if not hasattr(s, '_map_dir'):
+            s._map_dir = { '' : set() }
+            for path in s._map_path:
+                name = basename(path)
+                path = dirname(path)
+                while not s._map_dir.has_key(path):
+                    s._map_dir[path] = set()
+                    s._map_dir[path].add(name)
+                    (path, name) = (dirname(path), basename(path))
+                s._map_dir[path].add(name)
+
+        return s._map_dir
+
+    def listdir(s, path=''):
+
+        """List names in a directory of archive, raise OSError if not a directory"""
+
+        path = normalize(path)
+
+        try:
+            return sorted(s.directories()[path])
+        except KeyError:
+            raise OSError(errno.ENOTDIR if s._map_path.has_key(path) else errno.ENOENT,
+                    "No such directory in archive", path)
+
+    def stat(s, path):
+
+        """Stat a file or directory of archive, raise OSError if not found"""
+
+        path = normalize(path)
+
+        if s._map_path.has_key(path):
+            e = s._map_path[path]
+            return Stat(path, False, e.ExtractSize, e.FileSize, s.offset(e), e.ID)
+
+        if s.directories().has_key(path):
+            return Stat(path, True, 0, 0, None, None)
+
+        raise OSError(errno.ENOENT, "No such file or directory in archive", path)
+
+    def __iter__(s):
+
+        return iter(s.entries)
+
+    def __len__(s):
+
+        return len(s.entries)
+
+    def close(s):
+
+        s.f.close()
+
+class MappedArchive(Archive):
+
+    """
+    Archive reader backed by mmap
+
+    Tables are parsed from and raw entries returned as buffers into the mapping,
+    only uncompressed data is allocated. Pages are served by OS page cache.
+    """
+
+    def __init__(s, f, index=False, cache=None):
+
+        s.map = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+        Archive.__init__(s, f, index, cache)
+
+    def fragment(s, offset):
+
+        return Fragment.mapped(s.map, offset)
+
+    def pread(s, offset, size):
+
+        return s.map[offset:offset + size]
+
+    def readraw(s, entry):
+
+        return buffer(s.map, s.offset(entry), cell(entry, 'FileSize'))
+
+    def close(s):
+
+        s.map.close()
+
+        Archive.close(s)
+
+class ArchiveFile(RawIOBase):
+
+    """
+    Read-only file object of an entry in Archive
+
+    Raw data is read from archive on each read, CRILAYLA compressed data is
+    uncompressed on first read and served from memory afterwards.
+    """
+
+    def __init__(s, archive, entry):
+
+        RawIOBase.__init__(s)
+
+        (s.archive, s.entry) = (archive, entry)
+
+        s.name = archive.path(entry)
+        s.size = entry.ExtractSize
+        s.pos = 0
+
+        s.offset = archive.offset(entry)
+        s.compressed = archive.pread(s.offset, min(8, entry.FileSize)) == 'CRILAYLA'
+        s.data = None
+
+        if not s.compressed:
+            assert entry.FileSize == entry.ExtractSize
+
+    def readable(s):
+
+        return True
+
+    def seekable(s):
+
+        return True
+
+    def seek(s, offset, whence=SEEK_SET):
+
+        if s.closed:
+            raise ValueError("I/O operation on closed file")
+
+        if whence == SEEK_CUR:
+            offset += s.pos
+        elif whence == SEEK_END:
+            offset += s.size
+
+        if offset < 0:
+            raise IOError(errno.EINVAL, "Invalid argument", s.name)
+
+        s.pos = offset
+
+        return s.pos
+
+    def tell(s):
+
+        return s.pos
+
+    def read(s, n=-1):
+
+        if s.closed:
+            raise ValueError("I/O operation on closed file")
+
+        end = s.size if n is None or n < 0 else min(s.pos + n, s.size)
+
+        if end <= s.pos:
+            return ''
+
+        if s.compressed:
+            if s.data is None:
+                s.data = s.archive.read(s.entry)
+            data = s.data[s.pos:end]
+        else:
+            data = s.archive.pread(s.offset + s.pos, end - s.pos)
+
+        s.pos = end
+
+        return data
+
+    readall = read
+
+    def readinto(s, b):
+
+        data = s.read(len(b))
+        b[:len(data)] = data
+
+        return len(data)
+
+    def close(s):
+
+        s.data = None
+
+        RawIOBase.close(s)
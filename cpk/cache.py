@@ -0,0 +1,95 @@
+from collections import OrderedDict
+from threading import Lock
+
+# Default byte budget of EntryCache
+CACHE_BUDGET = 64 << 20
+
+class EntryCache(object):
+
+    """
+    LRU cache of uncompressed entries bounded by a byte budget
+
+    Keys are (archive identity, TOC row) as given by Archive, so one cache can
+    be shared by any number of archives. Data larger than the budget is never
+    cached.
+    """
+
+    def __init__(s, budget=CACHE_BUDGET):
+
+        s.budget = budget
+        s.size = 0
+
+        s.hits = 0
+        s.misses = 0
+        s.evictions = 0
+
+        s.items = OrderedDict()
+        s.lock = Lock()
+
+    def get(s, key):
+
+        """Get cached data of `key' and mark it recently used, None if not cached"""
+
+        with s.lock:
+            data = s.items.pop(key, None)
+            if data is None:
+                s.misses += 1
+                return None
+            s.items[key] = data
+            s.hits += 1
+            return data
+
+    def put(s, key, data):
+
+        """Cache `data' of `key', evicting least recently used data over budget"""
+
+        if len(data) > s.budget:
+            return
+
+        with s.lock:
+            old = s.items.pop(key, None)
+            if old is not None:
+                s.size -= len(old)
+
+            s.items[key] = data
+            s.size += len(data)
+
+            while s.size > s.budget:
+                (_, old) = s.items.popitem(last=False)
+                s.size -= len(old)
+                s.evictions += 1
+
+    def fetch(s, key, load):
+
+        """Get cached data of `key', or call `load()' and cache its result"""
+
+        data = s.get(key)
+
+        if data is None:
+            data = load()
+            s.put(key, data)
+
+        return data
+
+    def clear(s):
+
+        with s.lock:
+            s.items.clear()
+            s.size = 0
+
+    def stats(s):
+
+        """Counters as a dict"""
+
+        return {
+            'hits'      : s.hits,
+            'misses'    : s.misses,
+            'evictions' : s.evictions,
+            'entries'   : len(s.items),
+            'size'      : s.size,
+            'budget'    : s.budget,
+        }
+
+    def __len__(s):
+
+        return len(s.items)
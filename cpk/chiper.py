@@ -0,0 +1,98 @@
+
+from io import SEEK_SET, SEEK_CUR
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Default key of @UTF Table
+CHIPER_KEY = (0x5f, 0x15)
+
+# Data shorter than this is not worth a NumPy array
+CHIPER_NUMPY_THRESHOLD = 0x1000
+
+def keyset(c, m):
+    f = c
+    yield c
+    c = c * m & 0b11111111
+    while not c == f:
+        yield c
+        c = c * m & 0b11111111
+
+__keystreams = {}
+
+def keystream(key=CHIPER_KEY):
+
+    """
+    Get (period, tables) of a key, `period' is one period of the keystream and
+    `tables[i]' translates a byte by XOR with `period[i]'
+    """
+
+    if not __keystreams.has_key(key):
+        codes = [x for x in keyset(*key)]
+        period = ''.join(map(chr, codes))
+        tables = [''.join(chr(i ^ c) for i in xrange(256)) for c in codes]
+        __keystreams[key] = (period, tables)
+
+    return __keystreams[key]
+
+def crypt(data, pos=0, key=CHIPER_KEY):
+
+    """
+    Encrypt/Decrypt data starting at position `pos' of keystream
+
+    The keystream is periodic, so bytes in the same phase of the period are
+    translated with one table in bulk, or XORed with a tiled keystream by NumPy
+    """
+
+    (period, tables) = keystream(key)
+
+    n = len(data)
+    l = len(period)
+    pos %= l
+
+    if numpy and n >= CHIPER_NUMPY_THRESHOLD:
+        stream = (period[pos:] + period * (n / l + 1))[:n]
+        return (numpy.frombuffer(data, numpy.uint8) ^ numpy.frombuffer(stream, numpy.uint8)).tostring()
+
+    out = bytearray(n)
+
+    for i in xrange(min(l, n)):
+        out[i::l] = data[i::l].translate(tables[(pos + i) % l])
+
+    return str(out)
+
+class UTFChiper:
+
+    """Chiper for @UTF Table"""
+
+    def __init__(s, c=0x5f, m=0x15):
+
+        # Configure encrypt/decrypt key (balanced)
+        s.codes = keystream((c, m))[0]
+        s.pos = 0
+        s.c = c
+        s.m = m
+
+    def code(s, data):
+
+        """Encrypt/Decrypt data"""
+
+        data = crypt(data, s.pos, (s.c, s.m))
+
+        s.seek(len(data), SEEK_CUR)
+
+        return data
+
+    def seek(s, offset, whence = SEEK_SET):
+
+        if whence == SEEK_SET:
+            s.pos = offset % len(s.codes)
+
+        if whence == SEEK_CUR:
+            s.pos = (offset + s.pos) % len(s.codes)
+
+    def key(s):
+
+        return (ord(s.codes[s.pos]), s.m)
@@ -1,93 +1,439 @@
+
 from struct import pack, unpack
-from bitarray import bitarray
+from array import array
+from sys import byteorder
+from itertools import chain
 
-class CompressedIO:
+MINIMAL_REFLEN = 3
 
-    def __init__(s, data):
-        s.b = bitarray()
-        s.b.frombytes(data[::-1])
-        s.pos = 0
+# Bit width of each step in the reference length ladder, the last step repeats
+DEFLATE_LEVELS = [2, 3, 5, 8]
 
-    def read(s, length):
-        data = s.b[s.pos:s.pos+length]
-        s.pos += length
-        return data
+# Output bytes between two progress callbacks
+DEFLATE_FEED_INTERVAL = 0x10000
 
-    def read01(s, length):
-        return s.read(length).to01()
+def deflate_levels():
+    for v in DEFLATE_LEVELS:
+        yield v
+    while True:
+        yield DEFLATE_LEVELS[-1]
 
-    def readnum(s, length):
-        return int(s.read01(length), 2)
+def deflate_crilayla(data, size, feed=None):
 
-    def readbyte(s, length = 1):
-        return s.read(length * 8).tobytes()
+    """
+    Decode CRILAYLA compressed `data' to `size' bytes
 
-    def tell(s):
-        return s.pos
+    The bitstream is read from the end of `data' through a 64-bit accumulator
+    refilled a 32-bit word at a time, the output is produced into a buffer of
+    `size' bytes in reversed order and flipped once at the end.
 
-    def seek(s, offset, t = 0):
-        if t == 0:
-            s.pos = offset
-        elif t == 1:
-            s.pos += offset
-        elif t == 2:
-            s.pos = len(data) - 1 - offset
+    `feed(readptr, writeptr)' is called every DEFLATE_FEED_INTERVAL output bytes
+    when specified.
+    """
 
-    def close(s):
-        s.b = None
+    # Reversed stream padded with zero words, so that every token (and every
+    # step of a length ladder) can be read without checking for the tail
+    src = data[::-1] + '\x00' * (8 + (-len(data) % 4))
 
-def deflate_levels():
-    for v in [2, 3, 5, 8]:
-        yield v
-    while True:
-        yield 8
+    words = array('I', src)
+    assert words.itemsize == 4
+    if byteorder == 'little':
+        words.byteswap()
+
+    nwords = len(words)
+    out = bytearray(size)
 
-from contextlib import nested
+    acc = 0     # bit accumulator
+    nbits = 0   # number of unread bits in accumulator
+    wi = 0      # next word to load
+    wp = 0      # write pointer
 
-def deflate_crilayla(data, size, feed):
-    MINIMAL_REFLEN = 3
-    with nested(closing(CompressedIO(data)), closing(StringIO())) as (f, out):
-        while True:
-            feed(f.tell() >> 3, out.tell())
-            bit = f.read01(1)
-            if bit == '':
+    mark = DEFLATE_FEED_INTERVAL if feed else size + 1
+
+    while wp < size:
+
+        if nbits < 32:
+            if wi == nwords:
                 break
-            if int(bit, 2):
+            acc = (acc & ((1 << nbits) - 1)) << 32 | words[wi]
+            wi += 1
+            nbits += 32
 
-                offset = f.readnum(13) + MINIMAL_REFLEN
-                refc = MINIMAL_REFLEN
+            if wp >= mark:
+                feed(min((wi * 32 - nbits) >> 3, len(data)), wp)
+                mark = wp + DEFLATE_FEED_INTERVAL
 
-                for lv in deflate_levels():
-                    bits = f.read(lv)
-                    refc += int(bits.to01(), 2)
-                    if not bits.all():
-                        break
+        nbits -= 1
+        if acc >> nbits & 1:
 
-                # DEBUG
-                # curptr = out.tell()
-                # refs = curptr - offset
-                # s = out.getvalue()[refs: min(refs + refc, curptr)]
-                # print >>stderr, 'Control 1 0x%08x(-0x%04x)=0x%08x 0x%04x (0x%04x)%s' % (curptr, offset, refs, refc, len(s), repr(s))
-
-                assert out.tell() >= offset
-                while refc > 0:
-                    # read referenced bytes
-                    out.seek(-offset, 1)
-                    ref = out.read(refc)
-                    out.seek(0, 2)
-                    out.write(ref)
-                    refc -= len(ref)
+            nbits -= 13
+            offset = (acc >> nbits & 0x1fff) + MINIMAL_REFLEN
 
+            nbits -= 2
+            v = acc >> nbits & 0x03
+            refc = MINIMAL_REFLEN + v
+            if v == 0x03:
+                nbits -= 3
+                v = acc >> nbits & 0x07
+                refc += v
+                if v == 0x07:
+                    nbits -= 5
+                    v = acc >> nbits & 0x1f
+                    refc += v
+                    if v == 0x1f:
+                        v = 0xff
+                        while v == 0xff:
+                            if nbits < 8:
+                                if wi == nwords:
+                                    raise Exception("CRILAYLA stream truncated at 0x%08x/0x%08x" % (wp, size))
+                                acc = (acc & ((1 << nbits) - 1)) << 32 | words[wi]
+                                wi += 1
+                                nbits += 32
+                            nbits -= 8
+                            v = acc >> nbits & 0xff
+                            refc += v
+
+            ref = wp - offset
+            if ref < 0:
+                raise Exception("CRILAYLA back-reference before start of output at 0x%08x/0x%08x" % (wp, size))
+
+            end = wp + refc
+            if end > size:
+                end = size
+
+            if end - wp <= offset:
+                out[wp:end] = out[ref:ref + end - wp]
+            else:
+                # Overlapped reference repeats the last `offset' bytes, copy
+                # with chunks doubling in size
+                while wp < end:
+                    n = min(wp - ref, end - wp)
+                    out[wp:wp + n] = out[ref:ref + n]
+                    wp += n
+
+            wp = end
+
+        else:
+
+            # verbatim byte, three at once when the next two tokens are also
+            # verbatim bytes (26 bits are always buffered here)
+            v = acc >> (nbits - 26)
+            if not v & 0x20100 and wp + 3 <= size:
+                nbits -= 26
+                out[wp] = v >> 18 & 0xff
+                out[wp + 1] = v >> 9 & 0xff
+                out[wp + 2] = v & 0xff
+                wp += 3
             else:
-                # verbatim byte
-                b = f.readbyte()
+                nbits -= 8
+                out[wp] = acc >> nbits & 0xff
+                wp += 1
+
+    if (wi * 32 - nbits) > len(data) * 8:
+        raise Exception("CRILAYLA stream truncated at 0x%08x/0x%08x" % (wp, size))
+
+    out.reverse()
+
+    return str(out)
+
+# Farthest reference the 13-bit offset field can express
+COMPRESS_WINDOW = 0x1fff + MINIMAL_REFLEN
+
+# Match finder presets, (chain depth, nice length, parser)
+#   `chain depth' limits the candidates tried on a hash chain
+#   `nice length' stops searching once a match this long is found
+COMPRESS_GREEDY  = 'greedy'
+COMPRESS_LAZY    = 'lazy'
+COMPRESS_OPTIMAL = 'optimal'
+
+COMPRESS_PRESETS = {
+    COMPRESS_GREEDY  : (16,  32),
+    COMPRESS_LAZY    : (64,  128),
+    COMPRESS_OPTIMAL : (64,  256),
+}
+
+def match_length(buf, i, j, limit):
+
+    """Length of common prefix of buf[i:] and buf[j:] up to `limit'"""
+
+    n = 0
+    step = 8
+    while n < limit:
+        k = min(step, limit - n)
+        if buf[i + n:i + n + k] == buf[j + n:j + n + k]:
+            n += k
+            step <<= 1
+        elif k == 1:
+            break
+        else:
+            step = k >> 1
+    return n
+
+def reference_bits(refc):
+
+    """Number of bits taken by a reference of `refc' bytes"""
+
+    bits = 1 + 13
+    v = refc - MINIMAL_REFLEN
+    for lv in deflate_levels():
+        m = (1 << lv) - 1
+        bits += lv
+        if v < m:
+            return bits
+        v -= m
+
+class MatchFinder:
+
+    """
+    Hash chain match finder over the CRILAYLA window
+
+    Memory is fixed, chains start from a table of HASH slots indexed by a hash
+    of 3 bytes and link through a ring of RING positions. Positions out of the
+    window are never followed, so stale slots and links read as empty.
+    """
+
+    RING = 0x4000
+    HASH = 1 << 15
+
+    def __init__(s, buf, depth, nice):
+
+        (s.buf, s.depth, s.nice) = (buf, depth, nice)
+
+        s.bytes = bytearray(buf)
+        s.head = array('l', [-1]) * MatchFinder.HASH
+        s.prev = array('l', [-1]) * MatchFinder.RING
+
+        # Next position to be inserted
+        s.pos = 0
+
+    def insert(s, end):
+
+        """Insert all positions before `end' into hash chains"""
+
+        (b, head, prev) = (s.bytes, s.head, s.prev)
+        (ring, mask) = (MatchFinder.RING - 1, MatchFinder.HASH - 1)
+
+        for i in xrange(s.pos, min(end, len(b) - 2)):
+            key = (b[i] << 10 ^ b[i + 1] << 5 ^ b[i + 2]) & mask
+            prev[i & ring] = head[key]
+            head[key] = i
+
+        s.pos = max(s.pos, end)
+
+    def find(s, i):
+
+        """Find longest match at `i', return (length, distance)"""
+
+        s.insert(i)
 
-                # DEBUG
-                # print >>stderr, 'Control 0 0x%08x %s' % (out.tell(), repr(b))
+        buf = s.buf
+        limit = len(buf) - i
 
-                out.write(b)
+        if limit < MINIMAL_REFLEN:
+            return (0, 0)
 
-        return out.getvalue()[:size][::-1]
+        nice = min(s.nice, limit)
+        good = nice >> 1
+        best, dist = MINIMAL_REFLEN - 1, 0
+
+        (prev, mask) = (s.prev, MatchFinder.RING - 1)
+
+        b = s.bytes
+        j = s.head[(b[i] << 10 ^ b[i + 1] << 5 ^ b[i + 2]) & (MatchFinder.HASH - 1)]
+
+        # Candidates agreeing on the byte past the best count against depth,
+        # and no more than twice depth are walked
+        depth = s.depth
+        walk = depth << 1
+
+        while j >= 0 and i - j <= COMPRESS_WINDOW and depth > 0 and walk > 0:
+            walk -= 1
+            if i - j >= MINIMAL_REFLEN and buf[j + best] == buf[i + best]:
+                depth -= 1
+                # Only a candidate matching one byte more than the best is measured
+                if buf[j:j + best] == buf[i:i + best]:
+                    n = best + 1
+                    n += match_length(buf, i + n, j + n, nice - n)
+                    if best < good <= n:
+                        # A good match leaves a quarter of the chain to improve on it
+                        depth >>= 2
+                    best, dist = n, i - j
+                    if n >= nice:
+                        # Only the match taken is extended past nice length
+                        best += match_length(buf, i + n, j + n, limit - n)
+                        break
+            j = prev[j & mask]
+
+        if dist == 0:
+            return (0, 0)
+
+        return (best, dist)
+
+def parse_greedy(finder, n):
+
+    """Take the longest match at every position, yield (refc, offset) or (0, position)"""
+
+    i = 0
+    while i < n:
+        refc, offset = finder.find(i)
+        if refc:
+            yield (refc, offset)
+            i += refc
+        else:
+            yield (0, i)
+            i += 1
+
+def parse_lazy(finder, n):
+
+    """Take a match unless the next position has a longer one, yield (refc, offset) or (0, position)"""
+
+    i = 0
+    match = finder.find(0)
+    while i < n:
+        refc, offset = match
+        if refc and refc < finder.nice and i + 1 < n:
+            # Defer the match if the next position has a longer one
+            match = finder.find(i + 1)
+            if match[0] > refc:
+                yield (0, i)
+                i += 1
+                continue
+        if refc:
+            yield (refc, offset)
+            i += refc
+        else:
+            yield (0, i)
+            i += 1
+        if i < n:
+            match = finder.find(i)
+
+# Shortest remainder of a match taken at later positions without searching
+OPTIMAL_CARRY = 16
+
+def parse_optimal(finder, n):
+
+    """Minimize the total bit count over all matches found, yield (refc, offset) or (0, position)"""
+
+    # Shortest path over bit cost, cost[i] is the cheapest encoding of buf[:i]
+    INF = float('inf')
+    cost = [0] + [INF] * n
+    step = [(0, 0)] * (n + 1)
+
+    bits = [0] * MINIMAL_REFLEN + [reference_bits(l) for l in xrange(MINIMAL_REFLEN, finder.nice)]
+
+    # End of the last match found, and its offset
+    (carried, offset) = (0, 0)
+
+    i = 0
+    while i < n:
+
+        c = cost[i] + 9
+        if c < cost[i + 1]:
+            cost[i + 1], step[i + 1] = c, (0, i)
+
+        if carried - i >= OPTIMAL_CARRY:
+            # Inside a long match the rest of it is taken instead of searching
+            refc = carried - i
+        else:
+            refc, offset = finder.find(i)
+            carried = i + refc
+
+        if refc >= finder.nice:
+            # Long enough to take without considering alternatives
+            c = cost[i] + reference_bits(refc)
+            if c < cost[i + refc]:
+                cost[i + refc], step[i + refc] = c, (refc, offset)
+            i += refc
+            continue
+
+        # Every length is tried for short matches, long matches only try
+        # the ends of their length ladder steps
+        for l in chain(xrange(MINIMAL_REFLEN, min(refc, 32) + 1), [43, refc]):
+            if l > refc:
+                continue
+            c = cost[i] + bits[l]
+            if c < cost[i + l]:
+                cost[i + l], step[i + l] = c, (l, offset)
+
+        i += 1
+
+    path = []
+    i = n
+    while i > 0:
+        refc, offset = step[i]
+        path.append(step[i])
+        i -= refc or 1
+
+    return reversed(path)
+
+COMPRESS_PARSERS = {
+    COMPRESS_GREEDY  : parse_greedy,
+    COMPRESS_LAZY    : parse_lazy,
+    COMPRESS_OPTIMAL : parse_optimal,
+}
+
+def compress_crilayla(data, preset=COMPRESS_LAZY):
+
+    """
+    Encode `data' to a CRILAYLA bitstream, reverse of deflate_crilayla
+
+    `preset' is one of COMPRESS_PRESETS, trading speed against output size
+    """
+
+    (depth, nice) = COMPRESS_PRESETS[preset]
+
+    buf = data[::-1]
+    n = len(buf)
+
+    out = bytearray()
+    acc = 0
+    nbits = 0
+
+    for refc, offset in COMPRESS_PARSERS[preset](MatchFinder(buf, depth, nice), n):
+
+        if refc:
+            fields = [(1, 1), (offset - MINIMAL_REFLEN, 13)]
+            v = refc - MINIMAL_REFLEN
+            for lv in deflate_levels():
+                m = (1 << lv) - 1
+                fields.append((min(v, m), lv))
+                if v < m:
+                    break
+                v -= m
+        else:
+            # verbatim byte, `offset' is its position
+            fields = [(ord(buf[offset]), 9)]
+
+        for v, lv in fields:
+            acc = acc << lv | v
+            nbits += lv
+            if nbits >= 32:
+                nbits -= 32
+                out += pack('>L', acc >> nbits)
+                acc &= (1 << nbits) - 1
+
+    # Flush with zero padding to byte boundary
+    pad = -nbits % 8
+    acc <<= pad
+    nbits += pad
+    while nbits > 0:
+        nbits -= 8
+        out.append(acc >> nbits & 0xff)
+
+    out.reverse()
+
+    return str(out)
+
+def compress(data, preset=COMPRESS_LAZY):
+
+    """Make a CRILAYLA frame of `data', the first 0x100 bytes are kept raw"""
+
+    assert len(data) >= 0x100
+
+    compressed_data = compress_crilayla(data[0x100:], preset)
+
+    return pack('<8sLL', 'CRILAYLA', len(data) - 0x100, len(compressed_data)) + \
+            compressed_data + data[:0x100]
 
 def uncompress(data, uncompressed_size, extract_size, file_size):
 
@@ -115,5 +461,3 @@ def uncompress(data, uncompressed_size, extract_size, file_size):
     assert len(data) == uncompressed_size
 
     return raw_data_header + data
-
-
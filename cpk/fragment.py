@@ -22,9 +22,8 @@ def parse_cri_header(header):
 
 def make_cri_header(cri, length):
     s = ''
-    s += cri + '0x00' * (4 - len(cri) % 4)
-    s += pack('<L', length)
-    s += '0x00' * (0x10 - len(s) % 0x10)
+    s += cri.ljust(4) + '\xff\x00\x00\x00'
+    s += pack('<Q', length)
     return s
 
 class Fragment:
@@ -69,6 +68,24 @@ class Fragment:
 
         return s
 
+    @classmethod
+    def mapped(cls, m, offset):
+
+        """Like `special' but `data' is a buffer into mapping `m' instead of a copy"""
+
+        header = m[offset:offset + 0x10]
+
+        special = detect_fragment_type(header)
+        _, size = parse_cri_header(header)
+
+        s = cls()
+        s.data = buffer(m, offset + 0x10, size)
+        s.offset = offset
+        s.length = size
+        s.special = special
+
+        return s
+
     def dump(s, f):
         s.offset = f.tell()
         s.length = len(s.data)
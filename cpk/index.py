@@ -0,0 +1,67 @@
+from collections import namedtuple
+from functools import partial
+from hashlib import sha1
+import os
+import marshal
+
+# Bump on any change of the index layout
+INDEX_VERSION = 2
+
+# Sidecar file is stored next to the archive
+INDEX_SUFFIX = '.index'
+
+# TOC columns kept in index, and the row index in TOC which ITOC refers to
+Entry = namedtuple('Entry', [
+    'DirName', 'FileName', 'FileSize', 'ExtractSize', 'FileOffset', 'ID', 'TocIndex',
+])
+
+def indexpath(path):
+
+    return path + INDEX_SUFFIX
+
+def indexkey(f, header):
+
+    """
+    Key of archive file `f' with CPK header table data `header', an index
+    is valid as long as path, size, mtime and header are unchanged
+    """
+
+    st = os.fstat(f.fileno())
+
+    return (os.path.abspath(f.name), st.st_size, st.st_mtime, sha1(header).hexdigest())
+
+def loadindex(f, header):
+
+    """
+    Load TOC entries of archive `f' and their paths from sidecar, return
+    (entries, paths) or None if missing or stale
+    """
+
+    try:
+        key = indexkey(f, header)
+        with open(indexpath(f.name), 'rb') as idx:
+            (version, stored, entries, paths) = marshal.load(idx)
+    except (AttributeError, IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if version != INDEX_VERSION or stored != key:
+        return None
+
+    return (map(partial(tuple.__new__, Entry), entries), paths)
+
+def saveindex(f, header, entries, paths):
+
+    """Store TOC entries of archive `f' and their paths to sidecar, return False if not writable"""
+
+    try:
+        key = indexkey(f, header)
+        path = indexpath(f.name)
+
+        # Replace atomically so that a reader never sees a partial index
+        with open(path + '.tmp', 'wb') as idx:
+            marshal.dump((INDEX_VERSION, key, map(tuple, entries), paths), idx)
+        os.rename(path + '.tmp', path)
+    except (AttributeError, IOError, OSError):
+        return False
+
+    return True
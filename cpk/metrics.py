@@ -0,0 +1,141 @@
+from collections import defaultdict
+from timeit import default_timer
+import json
+
+# Least seconds between two sampled progress callbacks
+METRICS_INTERVAL = 0.1
+
+class Metrics(object):
+
+    """
+    Stage timers, counters and per-entry records of a run
+
+    Records are written to file `trace' as JSON lines when given.
+    `progress(stage, done, total)' is called by feeds made with `sampler', at
+    most every `interval' seconds.
+    """
+
+    def __init__(s, trace=None, progress=None, interval=METRICS_INTERVAL):
+
+        (s.trace, s.progress, s.interval) = (trace, progress, interval)
+
+        s.timers = defaultdict(float)
+        s.counters = defaultdict(int)
+
+        s.tick = 0
+
+    def stage(s, name):
+
+        """Context manager adding its elapsed time to timer `name'"""
+
+        return Stage(s.timers, name)
+
+    def timed(s, name, iterable):
+
+        """Iterate `iterable', adding time taken by each step to timer `name'"""
+
+        timers = s.timers
+        it = iter(iterable)
+
+        while True:
+            start = default_timer()
+            try:
+                item = next(it)
+            finally:
+                timers[name] += default_timer() - start
+            yield item
+
+    def add(s, name, seconds):
+
+        """Add `seconds' timed elsewhere, as in a worker process, to timer `name'"""
+
+        s.timers[name] += seconds
+
+    def count(s, name, n=1):
+
+        s.counters[name] += n
+
+    def record(s, **fields):
+
+        """Write a record, as a JSON line if tracing"""
+
+        if s.trace is not None:
+            s.trace.write(json.dumps(fields, sort_keys=True) + '\n')
+
+    def sampler(s, stage, total):
+
+        """Make a feed `feed(done)' of `stage' for `total' units, None without progress"""
+
+        if s.progress is None:
+            return None
+
+        def feed(done, force=False):
+            now = default_timer()
+            if now - s.tick < s.interval and not force:
+                return
+            s.tick = now
+            s.progress(stage, done, total)
+
+        return feed
+
+    def summary(s):
+
+        """Timers and counters as a dict"""
+
+        return {
+            'timers'    : dict(s.timers),
+            'counters'  : dict(s.counters),
+        }
+
+class Stage(object):
+
+    def __init__(s, timers, name):
+
+        (s.timers, s.name) = (timers, name)
+
+    def __enter__(s):
+
+        s.start = default_timer()
+
+    def __exit__(s, *exc):
+
+        s.timers[s.name] += default_timer() - s.start
+
+class NullStage(object):
+
+    def __enter__(s):
+        pass
+
+    def __exit__(s, *exc):
+        pass
+
+class NullMetrics(Metrics):
+
+    """Metrics doing nothing, the default where none is asked for"""
+
+    __stage = NullStage()
+
+    def __init__(s):
+
+        Metrics.__init__(s)
+
+    def stage(s, name):
+
+        return NullMetrics.__stage
+
+    def timed(s, name, iterable):
+
+        return iterable
+
+    def add(s, name, seconds):
+        pass
+
+    def count(s, name, n=1):
+        pass
+
+    def record(s, **fields):
+        pass
+
+    def sampler(s, stage, total):
+
+        return None
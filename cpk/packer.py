@@ -0,0 +1,447 @@
+from cStringIO import StringIO
+from posixpath import join, dirname, basename
+from shutil import copyfileobj
+from itertools import izip, imap
+from contextlib import contextmanager
+import os
+import time
+
+from utf import UTFTable, UTFTableIO, Column, Row, STRUCT_COLUMN_DATA
+from utf import COLUMN_STORAGE_PERROW, COLUMN_STORAGE_CONSTANT
+from utf import COLUMN_TYPE_STRING, COLUMN_TYPE_8BYTE, COLUMN_TYPE_4BYTE, COLUMN_TYPE_4BYTE2, COLUMN_TYPE_2BYTE
+from fragment import Fragment, FRAGMENT_CPK, FRAGMENT_TOC, FRAGMENT_ITOC, FRAGMENT_ETOC
+from crilayla import compress, COMPRESS_LAZY
+from archive import cell
+from transfer import copyrange
+
+# Alignment of CPK header region and default alignment of content
+PACK_ALIGN = 0x800
+
+# Smallest file worth a CRILAYLA frame, its first 0x100 bytes are kept raw
+PACK_COMPRESS_MIN = 0x100
+
+# Tables made without template, (table name, [(column, datatype)]), all per-row
+PACK_SCHEMA = {
+    FRAGMENT_CPK : ('CpkHeader', [
+        ('UpdateDateTime'   , COLUMN_TYPE_8BYTE),
+        ('ContentOffset'    , COLUMN_TYPE_8BYTE),
+        ('ContentSize'      , COLUMN_TYPE_8BYTE),
+        ('TocOffset'        , COLUMN_TYPE_8BYTE),
+        ('TocSize'          , COLUMN_TYPE_8BYTE),
+        ('ItocOffset'       , COLUMN_TYPE_8BYTE),
+        ('ItocSize'         , COLUMN_TYPE_8BYTE),
+        ('EtocOffset'       , COLUMN_TYPE_8BYTE),
+        ('EtocSize'         , COLUMN_TYPE_8BYTE),
+        ('Files'            , COLUMN_TYPE_4BYTE),
+        ('Align'            , COLUMN_TYPE_2BYTE),
+    ]),
+    FRAGMENT_TOC : ('CpkTocInfo', [
+        ('DirName'          , COLUMN_TYPE_STRING),
+        ('FileName'         , COLUMN_TYPE_STRING),
+        ('FileSize'         , COLUMN_TYPE_4BYTE),
+        ('ExtractSize'      , COLUMN_TYPE_4BYTE),
+        ('FileOffset'       , COLUMN_TYPE_8BYTE),
+        ('ID'               , COLUMN_TYPE_4BYTE),
+    ]),
+    FRAGMENT_ITOC : ('CpkItocInfo', [
+        ('ID'               , COLUMN_TYPE_4BYTE2),
+        ('TocIndex'         , COLUMN_TYPE_4BYTE2),
+    ]),
+    FRAGMENT_ETOC : ('CpkEtocInfo', [
+        ('UpdateDateTime'   , COLUMN_TYPE_8BYTE),
+        ('LocalDir'         , COLUMN_TYPE_STRING),
+    ]),
+}
+
+def alignup(offset, align):
+
+    return (offset + align - 1) / align * align
+
+def datetimevalue(t):
+
+    """Pack time `t' (seconds since epoch) to a @UTF UpdateDateTime value"""
+
+    t = time.localtime(t)
+
+    return t.tm_year << 48 | t.tm_mon << 40 | t.tm_mday << 32 | \
+            t.tm_hour << 24 | t.tm_min << 16 | t.tm_sec << 8
+
+def newtable(special, encrypted=False):
+
+    """Make an empty @UTF Table of `special' with the default schema"""
+
+    (name, schema) = PACK_SCHEMA[special]
+
+    t = UTFTable()
+    t.encrypted = encrypted
+    t.table_name = name
+
+    for col, datatype in schema:
+        t.cols.append(Column(t, col, COLUMN_STORAGE_PERROW, datatype))
+
+    return t
+
+def clonetable(template):
+
+    """Make an empty @UTF Table with the name and Columns of `template'"""
+
+    t = UTFTable()
+    t.encrypted = template.encrypted
+    t.table_name = template.table_name
+
+    for c in template.cols:
+
+        col = Column(t, c.name, c.storage, c.datatype)
+
+        if c.be(COLUMN_STORAGE_CONSTANT):
+            # String constant points to StringTable of template
+            if c.be(COLUMN_TYPE_STRING):
+                col.const = (t.string(template.string(c.const)), )
+            else:
+                col.const = c.const
+
+        t.cols.append(col)
+
+    return t
+
+def newrow(t, values, template=None):
+
+    """
+    Append a Row to @UTF Table `t', per-row Columns are taken from dict
+    `values', then from Row `template', then zero (or empty string)
+    """
+
+    r = Row(t)
+
+    for c in t.cols:
+
+        if not c.be(COLUMN_STORAGE_PERROW):
+            continue
+
+        if values.has_key(c.name):
+            val = values[c.name]
+        elif template is not None:
+            val = getattr(template, c.name)
+        elif c.be(COLUMN_TYPE_STRING):
+            val = '<NULL>'
+        else:
+            val = (0, ) * (len(STRUCT_COLUMN_DATA[c.datatype]) - 1)
+
+        if type(val) not in [str, tuple]:
+            val = (val, )
+
+        setattr(r, c.name, val)
+
+    t.rows.append(r)
+
+    return r
+
+def setcells(row, values):
+
+    """Set cells of Columns present in `row'"""
+
+    for key, val in values.items():
+        if key in [c.name for c in row.utf.cols if c.be(COLUMN_STORAGE_PERROW)]:
+            setattr(row, key, val if type(val) in [str, tuple] else (val, ))
+
+def tabledata(t):
+
+    """Dump @UTF Table `t' to a string"""
+
+    f = StringIO()
+    t.dump(UTFTableIO(f, encrypted=t.encrypted))
+
+    return f.getvalue()
+
+def writetable(f, special, t, align=PACK_ALIGN):
+
+    """Write @UTF Table `t' as `special' fragment padded to `align', return its size"""
+
+    fragment = Fragment()
+    fragment.special = special
+    fragment.align = align
+    fragment.data = tabledata(t)
+    fragment.dump(f)
+
+    return fragment.length + 0x10
+
+def packworker(task):
+
+    """Make CRILAYLA frame of a file, None if it is to be stored raw"""
+
+    (path, preset, force) = task
+
+    if preset is None:
+        return None
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < PACK_COMPRESS_MIN:
+        return None
+
+    frame = compress(data, preset)
+
+    if len(frame) >= len(data) and not force:
+        return None
+
+    return frame
+
+def compressed(row):
+
+    """Whether the file of a TOC row is compressed"""
+
+    return row is not None and cell(row, 'FileSize') != cell(row, 'ExtractSize')
+
+def listfiles(root):
+
+    """Map path in archive to path on disk of every file under `root'"""
+
+    found = {}
+
+    for top, dirs, files in os.walk(root):
+        for name in files:
+            local = os.path.join(top, name)
+            found[os.path.relpath(local, root).replace(os.sep, '/')] = local
+
+    return found
+
+@contextmanager
+def workers(jobs):
+
+    """Context of an imap like function running on `jobs' worker processes, in process without jobs"""
+
+    if not jobs:
+        yield imap
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+
+    try:
+        yield pool.imap
+    except:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
+
+class Packer(object):
+
+    """
+    Streaming CPK archive writer
+
+    Files are written one by one into the content region while tables are
+    kept in memory, the CPK header and TOC are written last into the room
+    reserved at the head of the archive. TOC size only depends on names, so
+    the room is known before any content is written.
+
+    With `template', an Archive, tables are made with the schema of the
+    template and cells not known to the packer are copied from it. A file
+    compressed in template is compressed again.
+
+    With `reuse', files of template missing in `root' are copied as stored
+    in template, so only changed files are read and compressed.
+    """
+
+    def __init__(s, root, template=None, preset=None, encrypted=False, align=PACK_ALIGN, reuse=False):
+
+        (s.root, s.template, s.preset, s.reuse) = (root, template, preset, reuse)
+
+        s.encrypted = encrypted
+        s.align = align
+
+        if template is not None:
+            s.align = cell(template.header, 'Align') or align
+            if s.preset is None:
+                s.preset = COMPRESS_LAZY
+
+        s.files = s.scan()
+
+    def scan(s):
+
+        """
+        List files to pack as (path in archive, path on disk, template TOC row),
+        path on disk is None for a file reused from template
+        """
+
+        found = listfiles(s.root)
+
+        if s.template is None:
+            return [(name, found[name], None) for name in sorted(found)]
+
+        # Files of template first in TOC order, then new files
+        rows = s.template.toc.rows
+        listed = []
+
+        for row in rows:
+            path = join(cell(row, 'DirName') or '', cell(row, 'FileName'))
+            if found.has_key(path):
+                listed.append((path, found.pop(path), row))
+            elif s.reuse:
+                listed.append((path, None, row))
+            else:
+                raise Exception("File `%s' of template is missing in `%s'" % (path, s.root))
+
+        return listed + [(name, found[name], None) for name in sorted(found)]
+
+    def table(s, special):
+
+        """Make an empty table of `special', None if template has no such table"""
+
+        if s.template is None:
+            return newtable(special, s.encrypted)
+
+        if not s.template.fragments.has_key(special):
+            return None
+
+        return clonetable(s.template.table(special))
+
+    def pack(s, f, jobs=0, feed=None):
+
+        """
+        Write archive to seekable file `f' with `jobs' worker processes
+        compressing files, `feed(path, size, stored)' is called for each file
+        """
+
+        toc = s.table(FRAGMENT_TOC)
+
+        rows = []
+
+        # New files are numbered after files of template
+        ids = [cell(template, 'ID') for _, _, template in s.files if template is not None]
+        nextid = max(ids) + 1 if ids else 0
+
+        for path, local, template in s.files:
+
+            if local is None:
+                (stored, size) = (cell(template, 'FileSize'), cell(template, 'ExtractSize'))
+            else:
+                stored = size = os.path.getsize(local)
+
+            if template is None:
+                (fileid, nextid) = (nextid, nextid + 1)
+            else:
+                fileid = cell(template, 'ID')
+
+            rows.append(newrow(toc, {
+                'DirName'       : dirname(path),
+                'FileName'      : basename(path),
+                'FileSize'      : stored,
+                'ExtractSize'   : size,
+                'FileOffset'    : 0,
+                'ID'            : fileid,
+            }, template))
+
+        # Room for header and TOC
+        tocoffset = PACK_ALIGN
+        tocsize = len(tabledata(toc)) + 0x10
+        contentoffset = alignup(tocoffset + tocsize, s.align)
+
+        f.write('\x00' * contentoffset)
+
+        if s.template is None:
+            tasks = [(disk, s.preset, False) for _, disk, _ in s.files]
+        else:
+            tasks = [(disk, s.preset if disk and compressed(row) else None, True)
+                    for _, disk, row in s.files]
+
+        pos = contentoffset
+
+        with workers(jobs) as mapper:
+
+            for (path, local, template), row, frame in izip(s.files, rows, mapper(packworker, tasks)):
+
+                f.write('\x00' * (pos - f.tell()))
+
+                if local is None:
+                    # Stored data of template is copied as is, compressed or not
+                    copyrange(s.template.f, f, s.template.offset(template), cell(template, 'FileSize'))
+                elif frame is None:
+                    with open(local, 'rb') as data:
+                        copyfileobj(data, f)
+                else:
+                    f.write(frame)
+
+                setcells(row, {
+                    'FileOffset'    : pos - tocoffset,
+                    'FileSize'      : f.tell() - pos,
+                })
+
+                if feed:
+                    feed(path, row.ExtractSize[0], row.FileSize[0])
+
+                pos = alignup(f.tell(), s.align)
+
+        contentsize = pos - contentoffset
+
+        header = {
+            'UpdateDateTime'    : datetimevalue(time.time()),
+            'ContentOffset'     : contentoffset,
+            'ContentSize'       : contentsize,
+            'TocOffset'         : tocoffset,
+            'TocSize'           : tocsize,
+            'ItocOffset'        : 0,
+            'ItocSize'          : 0,
+            'EtocOffset'        : 0,
+            'EtocSize'          : 0,
+            'Files'             : len(rows),
+            'Align'             : s.align,
+            'EnabledPackedSize' : sum(r.FileSize[0] for r in rows),
+            'EnabledDataSize'   : sum(r.ExtractSize[0] for r in rows),
+        }
+
+        # ITOC and ETOC follow content
+        itoc = s.table(FRAGMENT_ITOC)
+
+        if itoc is not None:
+            for i, r in enumerate(rows):
+                newrow(itoc, { 'ID' : r.ID[0], 'TocIndex' : i })
+            f.write('\x00' * (pos - f.tell()))
+            header['ItocOffset'] = pos
+            header['ItocSize'] = writetable(f, FRAGMENT_ITOC, itoc, s.align)
+            pos = f.tell()
+
+        etoc = s.table(FRAGMENT_ETOC)
+
+        if etoc is not None:
+            (template, trailing) = ([], [])
+            if s.template:
+                # Rows of template past its files, as a terminator, stay last
+                rows = s.template.table(FRAGMENT_ETOC).rows
+                (template, trailing) = (rows[:len(s.template.toc)], rows[len(s.template.toc):])
+            for i, (path, local, _) in enumerate(s.files):
+                # Reused file keeps its row of template
+                values = {} if local is None else {
+                    'UpdateDateTime'    : datetimevalue(os.path.getmtime(local)),
+                    'LocalDir'          : dirname(path),
+                }
+                newrow(etoc, values, template[i] if i < len(template) else None)
+            for row in trailing:
+                newrow(etoc, {}, row)
+            f.write('\x00' * (pos - f.tell()))
+            header['EtocOffset'] = pos
+            header['EtocSize'] = writetable(f, FRAGMENT_ETOC, etoc, s.align)
+            pos = f.tell()
+
+        f.write('\x00' * (pos - f.tell()))
+
+        # Header and TOC are written last into the room reserved
+        cpk = s.table(FRAGMENT_CPK)
+        newrow(cpk, {}, s.template.header if s.template else None)
+        setcells(cpk.rows[0], header)
+
+        # CPK fragment is padded with copyright mark to the end of its region
+        f.seek(0)
+        writetable(f, FRAGMENT_CPK, cpk)
+
+        if f.tell() != tocoffset:
+            raise Exception("CPK header overflows 0x%x bytes" % tocoffset)
+
+        assert writetable(f, FRAGMENT_TOC, toc, s.align) == tocsize
+
+        f.seek(pos)
+
+        return len(rows)
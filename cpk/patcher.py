@@ -0,0 +1,171 @@
+from itertools import izip
+from shutil import copyfileobj
+from io import SEEK_END
+import os
+import time
+
+from fragment import FRAGMENT_CPK, FRAGMENT_TOC, FRAGMENT_ITOC, FRAGMENT_ETOC, make_cri_header
+from crilayla import COMPRESS_LAZY
+from archive import Archive, cell
+from packer import alignup, datetimevalue, newrow, setcells, tabledata, writetable, packworker, PACK_ALIGN
+from packer import compressed, listfiles, workers
+
+class Patcher(object):
+
+    """
+    Append-only in-place patcher of CPK archive
+
+    New and replaced files are appended after the end of archive, followed by
+    new TOC, ITOC and ETOC tables. The CPK header is rewritten in place last,
+    so the archive stays valid with its old tables until the patch completes.
+    Replaced data is left in place, repacking with reuse compacts it.
+    """
+
+    def __init__(s, f, root, preset=None):
+
+        (s.f, s.root, s.preset) = (f, root, preset)
+
+        s.archive = Archive(f)
+        s.align = cell(s.archive.header, 'Align') or PACK_ALIGN
+
+        s.files = s.scan()
+
+    def scan(s):
+
+        """List files to patch as (path in archive, path on disk, TOC row index or None if new)"""
+
+        listed = []
+
+        for path, local in listfiles(s.root).items():
+            try:
+                i = s.archive.find(path).TocIndex
+            except KeyError:
+                i = None
+            listed.append((path, local, i))
+
+        return sorted(listed)
+
+    def patch(s, jobs=0, feed=None):
+
+        """
+        Append files and tables to archive, `jobs' worker processes compress
+        files, `feed(path, size, stored)' is called for each file
+        """
+
+        (a, f) = (s.archive, s.f)
+
+        toc = a.toc
+        header = a.header
+
+        # Absolute offsets of entries, FileOffset is rebased at last
+        offsets = [a.offset(r) for r in toc.rows]
+
+        ids = [cell(r, 'ID') for r in toc.rows]
+        nextid = max(ids) + 1 if ids else 0
+
+        itoc = a.table(FRAGMENT_ITOC) if a.fragments.has_key(FRAGMENT_ITOC) else None
+        etoc = a.table(FRAGMENT_ETOC) if a.fragments.has_key(FRAGMENT_ETOC) else None
+
+        # Compressed files stay compressed, others are compressed with a
+        # preset only, if smaller
+        tasks = []
+
+        for path, local, i in s.files:
+            if i is not None and compressed(toc.rows[i]):
+                tasks.append((local, s.preset or COMPRESS_LAZY, True))
+            else:
+                tasks.append((local, s.preset, False))
+
+        f.seek(0, SEEK_END)
+        pos = alignup(f.tell(), s.align)
+
+        with workers(jobs) as mapper:
+
+            for (path, local, i), frame in izip(s.files, mapper(packworker, tasks)):
+
+                f.write('\x00' * (pos - f.tell()))
+
+                if frame is None:
+                    with open(local, 'rb') as data:
+                        copyfileobj(data, f)
+                else:
+                    f.write(frame)
+
+                values = {
+                    'FileSize'      : f.tell() - pos,
+                    'ExtractSize'   : os.path.getsize(local),
+                }
+
+                if i is None:
+                    values.update({
+                        'DirName'       : os.path.dirname(path),
+                        'FileName'      : os.path.basename(path),
+                        'FileOffset'    : 0,
+                        'ID'            : nextid,
+                    })
+                    newrow(toc, values)
+                    offsets.append(pos)
+                    nextid += 1
+                    if itoc is not None:
+                        newrow(itoc, { 'ID' : values['ID'], 'TocIndex' : len(toc.rows) - 1 })
+                    if etoc is not None:
+                        newrow(etoc, {
+                            'UpdateDateTime'    : datetimevalue(os.path.getmtime(local)),
+                            'LocalDir'          : values['DirName'],
+                        })
+                        # ETOC rows follow TOC, a trailing terminator row stays last
+                        etoc.rows.insert(len(toc.rows) - 1, etoc.rows.pop())
+                else:
+                    setcells(toc.rows[i], values)
+                    offsets[i] = pos
+                    if etoc is not None and i < len(etoc.rows):
+                        setcells(etoc.rows[i], { 'UpdateDateTime' : datetimevalue(os.path.getmtime(local)) })
+
+                if feed:
+                    feed(path, values['ExtractSize'], values['FileSize'])
+
+                pos = alignup(f.tell(), s.align)
+
+        contentoffset = cell(header, 'ContentOffset')
+
+        # TOC now follows content, so FileOffset is relative to content
+        values = {
+            'UpdateDateTime'    : datetimevalue(time.time()),
+            'ContentSize'       : pos - contentoffset,
+            'TocOffset'         : pos,
+            'Files'             : len(toc.rows),
+            'EnabledPackedSize' : sum(cell(r, 'FileSize') for r in toc.rows),
+            'EnabledDataSize'   : sum(cell(r, 'ExtractSize') for r in toc.rows),
+        }
+
+        baseline = min(contentoffset, pos)
+
+        for row, offset in izip(toc.rows, offsets):
+            setcells(row, { 'FileOffset' : offset - baseline })
+
+        f.write('\x00' * (pos - f.tell()))
+
+        values['TocSize'] = writetable(f, FRAGMENT_TOC, toc, s.align)
+
+        if itoc is not None:
+            values['ItocOffset'] = f.tell()
+            values['ItocSize'] = writetable(f, FRAGMENT_ITOC, itoc, s.align)
+
+        if etoc is not None:
+            values['EtocOffset'] = f.tell()
+            values['EtocSize'] = writetable(f, FRAGMENT_ETOC, etoc, s.align)
+
+        # CPK header is rewritten in place, its size is fixed by the schema
+        setcells(header, values)
+
+        data = tabledata(a.table(FRAGMENT_CPK))
+        room = len(a.fragments[FRAGMENT_CPK].data)
+
+        if len(data) > room:
+            raise Exception("CPK header grows from 0x%x to 0x%x bytes" % (room, len(data)))
+
+        f.seek(0)
+        f.write(make_cri_header(FRAGMENT_CPK, room) + data + '\x00' * (room - len(data)))
+        f.flush()
+
+        return len(s.files)
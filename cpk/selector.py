@@ -0,0 +1,96 @@
+from fnmatch import translate
+import re
+
+# Prefixes of rule specifications, a rule without prefix is a path glob
+SELECTOR_GLOB     = 'glob'
+SELECTOR_REGEX    = 're'
+SELECTOR_ID       = 'id'
+SELECTOR_TOCINDEX = 'index'
+
+def numbers(spec):
+
+    """Parse `1,4,10-20' to a set of numbers, ranges are inclusive, raise ValueError if malformed"""
+
+    values = set()
+
+    for part in spec.split(','):
+        if '-' in part[1:]:
+            (lo, hi) = part.split('-', 1)
+            (lo, hi) = (int(lo, 0), int(hi, 0))
+            if lo > hi:
+                raise ValueError("range %s is reversed" % part)
+            values.update(xrange(lo, hi + 1))
+        else:
+            values.add(int(part, 0))
+
+    return values
+
+def rule(spec):
+
+    """
+    Compile a rule specification to a predicate of (path, entry), raise
+    ValueError naming the rule if malformed
+
+        <glob>            DirName/FileName matches glob, `*' crosses `/'
+        re:<regex>        DirName/FileName contains match of regex
+        id:<numbers>      TOC ID is one of numbers
+        index:<numbers>   TOC row index (as referenced by ITOC TocIndex) is one of numbers
+    """
+
+    (kind, sep, arg) = spec.partition(':')
+
+    if not sep or kind not in [SELECTOR_GLOB, SELECTOR_REGEX, SELECTOR_ID, SELECTOR_TOCINDEX]:
+        (kind, arg) = (SELECTOR_GLOB, spec)
+
+    if kind == SELECTOR_GLOB:
+        match = re.compile(translate(arg)).match
+        return lambda path, entry: match(path) is not None
+
+    if kind == SELECTOR_REGEX:
+        try:
+            search = re.compile(arg).search
+        except re.error as e:
+            raise ValueError("Rule `%s' has an invalid regex (%s)" % (spec, e))
+        return lambda path, entry: search(path) is not None
+
+    try:
+        values = numbers(arg)
+    except ValueError as e:
+        raise ValueError("Rule `%s' expects numbers as 1,4,10-20 (%s)" % (spec, e))
+
+    if kind == SELECTOR_ID:
+        return lambda path, entry: entry.ID in values
+
+    return lambda path, entry: entry.TocIndex in values
+
+class Selector(object):
+
+    """
+    Include/exclude rules over TOC entries
+
+    An entry is selected if it matches any include rule (or there is none)
+    and no exclude rule. Rules are resolved against the TOC entries only,
+    no data of the archive is read.
+    """
+
+    def __init__(s, include=[], exclude=[]):
+
+        s.include = map(rule, include)
+        s.exclude = map(rule, exclude)
+
+    def __nonzero__(s):
+
+        return bool(s.include or s.exclude)
+
+    def match(s, path, entry):
+
+        if s.include and not any(r(path, entry) for r in s.include):
+            return False
+
+        return not any(r(path, entry) for r in s.exclude)
+
+    def select(s, archive):
+
+        """List entries of `archive' selected, in archive order"""
+
+        return [e for e in archive if s.match(archive.path(e), e)]
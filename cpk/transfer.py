@@ -0,0 +1,118 @@
+
+import os, errno
+
+# Chunk size of buffered copy
+TRANSFER_CHUNK = 0x100000
+
+def __libc():
+
+    """Bind copy_file_range/sendfile of libc when os module does not provide them"""
+
+    try:
+        import ctypes, ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (ImportError, OSError, TypeError):
+        return {}
+
+    calls = {}
+
+    def bind(name, argtypes):
+        try:
+            func = getattr(libc, name)
+        except AttributeError:
+            return None
+        func.argtypes = argtypes
+        func.restype = ctypes.c_ssize_t
+        return func
+
+    def check(n):
+        if n < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return n
+
+    off_t = ctypes.c_int64
+    c_copy_file_range = bind('copy_file_range', [
+        ctypes.c_int, ctypes.POINTER(off_t), ctypes.c_int, ctypes.POINTER(off_t), ctypes.c_size_t, ctypes.c_uint])
+    c_sendfile = bind('sendfile64', [
+        ctypes.c_int, ctypes.c_int, ctypes.POINTER(off_t), ctypes.c_size_t])
+    if not c_sendfile and ctypes.sizeof(ctypes.c_long) == 8:
+        c_sendfile = bind('sendfile', [
+            ctypes.c_int, ctypes.c_int, ctypes.POINTER(off_t), ctypes.c_size_t])
+
+    if c_copy_file_range:
+        def copy_file_range(src, dst, count, offset_src):
+            return check(c_copy_file_range(src, ctypes.byref(off_t(offset_src)), dst, None, count, 0))
+        calls['copy_file_range'] = copy_file_range
+
+    if c_sendfile:
+        def sendfile(out_fd, in_fd, offset, count):
+            return check(c_sendfile(out_fd, in_fd, ctypes.byref(off_t(offset)), count))
+        calls['sendfile'] = sendfile
+
+    return calls
+
+__calls = __libc() if not hasattr(os, 'sendfile') else {}
+
+copy_file_range = getattr(os, 'copy_file_range', None) or __calls.get('copy_file_range')
+sendfile = getattr(os, 'sendfile', None) or __calls.get('sendfile')
+
+def kernelcopy(src, dst, offset, size):
+
+    """Copy with copy_file_range/sendfile, return bytes copied before falling back"""
+
+    copied = 0
+
+    for call in [copy_file_range, sendfile]:
+
+        if not call:
+            continue
+
+        try:
+            while copied < size:
+                if call == copy_file_range:
+                    n = call(src, dst, size - copied, offset + copied)
+                else:
+                    n = call(dst, src, offset + copied, size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError as exc:
+            # Not supported between these files, try next method
+            if exc.errno not in [errno.EINVAL, errno.ENOSYS, errno.EXDEV, errno.EBADF, errno.EOPNOTSUPP]:
+                raise
+
+        if copied == size:
+            break
+
+    return copied
+
+def copyrange(src, dst, offset, size):
+
+    """
+    Copy `size' bytes at `offset' of file `src' to current position of file `dst'
+
+    Data is copied by kernel when possible, otherwise by buffered read/write.
+    Position of `src' is not kept.
+    """
+
+    dst.flush()
+
+    start = dst.tell()
+    os.lseek(dst.fileno(), start, os.SEEK_SET)
+
+    copied = kernelcopy(src.fileno(), dst.fileno(), offset, size)
+
+    # Sync file object with position moved by kernel
+    dst.seek(start + copied)
+
+    src.seek(offset + copied)
+
+    while copied < size:
+        data = src.read(min(TRANSFER_CHUNK, size - copied))
+        if not data:
+            raise IOError("Unexpected end of file at 0x%x" % (offset + copied))
+        dst.write(data)
+        copied += len(data)
+
+    return copied
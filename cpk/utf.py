@@ -1,9 +1,15 @@
 from io import SEEK_SET, SEEK_CUR, SEEK_END
-from struct import calcsize, pack, unpack
-from array import array
+from struct import calcsize, pack, unpack, Struct
 from cStringIO import StringIO
 from contextlib import closing, nested
 
+from chiper import UTFChiper
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # @UTF Table Constants Definition (From utf_table)
 # Suspect that "type 2" is signed
 COLUMN_STORAGE_MASK       = 0xf0
@@ -41,51 +47,57 @@ STRUCT_COLUMN_DATA      = {
     COLUMN_TYPE_1BYTE   : '>B',
 }
 
-STRUCT_TABLE_HEADER = '>4sL'
-STRUCT_BODY_HEADER = '>LLLLHHL'
+# NumPy types of struct codes used by STRUCT_COLUMN_DATA
+NUMPY_TYPE_MAP = {
+    'Q' : 'u8', 'L' : 'u4', 'l' : 'i4', 'H' : 'u2', 'h' : 'i2',
+    'B' : 'u1', 'b' : 'i1', 'f' : 'f4',
+}
 
-def keyset(c, m):
-    f = c
-    yield c
-    c = c * m & 0b11111111
-    while not c == f:
-        yield c
-        c = c * m & 0b11111111
+def coldtype(datatype):
 
-class UTFChiper:
+    """Big-endian NumPy type of a Column data type, a (type, count) pair for DATA"""
 
-    """Chiper for @UTF Table"""
+    pattern = STRUCT_COLUMN_DATA[datatype]
 
-    def __init__(s, c=0x5f, m=0x15):
+    (order, codes) = (pattern[0], pattern[1:])
 
-        # Configure encrypt/decrypt key (balanced)
-        s.codes = [x for x in keyset(c, m)]
-        s.pos = 0
-        s.m = m
+    t = order + NUMPY_TYPE_MAP[codes[0]]
 
-    def code(s, data):
+    return t if len(codes) == 1 else (t, len(codes))
 
-        """Encrypt/Decrypt data"""
+def rowdtype(cols):
 
-        v = array('B', data)
+    """NumPy structured dtype of one row, `cols' is a list of (name, datatype) per-row Columns"""
 
-        for i in xrange(len(v)):
-            v[i] = v[i] ^ s.codes[s.pos] & 0b11111111
-            s.seek(1, SEEK_CUR)
+    if numpy is None:
+        raise Exception("NumPy is required for columnar access")
 
-        return v.tostring()
+    return numpy.dtype([(name, coldtype(datatype)) for name, datatype in cols])
 
-    def seek(s, offset, whence = SEEK_SET):
+def rowarray(cols, data, count):
 
-        if whence == SEEK_SET:
-            s.pos = offset % len(s.codes)
+    """Decode `count' rows of the rows region `data' into a structured array without copy"""
 
-        if whence == SEEK_CUR:
-            s.pos = (offset + s.pos) % len(s.codes)
+    dtype = rowdtype(cols)
 
-    def key(s):
+    if not dtype.itemsize:
+        return numpy.zeros(count, dtype)
 
-        return (s.codes[s.pos], s.m)
+    return numpy.frombuffer(data, dtype, count)
+
+def stringarray(offsets, resolve):
+
+    """Resolve an array of string `offsets' with `resolve([offset])', each distinct offset once"""
+
+    (uniq, inverse) = numpy.unique(offsets, return_inverse=True)
+
+    strings = numpy.empty(len(uniq), object)
+    strings[:] = resolve(uniq.tolist())
+
+    return strings[inverse]
+
+STRUCT_TABLE_HEADER = '>4sL'
+STRUCT_BODY_HEADER = '>LLLLHHL'
 
 class UTFTableIO:
 
@@ -180,19 +192,45 @@ class StringTable:
 
         s = cls();
 
-        init = data.strip('\x00').split('\x00')
-
-        for entry in init:
-            s.__getitem__(entry)    # Invoke __getitem__ to register mapping
+        # Entries are indexed on first need, until then an offset is looked
+        # up straight in `data'
+        (s.entry, s._map_stoo, s._map_otos, s.data) = (None, {}, {}, data)
 
         return s;
 
+    def index(s):
+
+        """Index every entry of parsed data"""
+
+        data = s.data
+
+        # Index every entry at its real offset, duplicated and empty entries
+        # (including the padding) are kept so that offsets referenced by the
+        # table stay valid
+        (s.entry, s._map_stoo, s._map_otos, s.bytecounter) = ([], {}, {}, 0)
+
+        for entry in data.split('\x00')[:-1]:
+
+            entry = intern(entry)
+
+            s.entry.append(entry)
+
+            s._map_otos[s.bytecounter] = entry
+            s._map_stoo.setdefault(entry, s.bytecounter)
+
+            s.bytecounter += len(entry) + 1 # For \x00 byte
+
+        s.data = None
+
     def __getitem__(s, key):
 
         """Given string return offset; Given offset return string"""
 
         if type(key) == str:
 
+            if s.entry is None:
+                s.index()
+
             if s._map_stoo.has_key(key):
                 
                 return s._map_stoo[key]
@@ -216,12 +254,42 @@ class StringTable:
 
                 return s._map_otos[key]
 
-            else:
-                
-                raise Exception("Cannot find string entry at 0x%x" % (key))
+            # An entry starts at offset 0 or right after a terminator
+            if s.entry is None and 0 <= key < len(s.data) and (key == 0 or s.data[key - 1] == '\x00'):
+
+                end = s.data.find('\x00', key)
+
+                if end >= 0:
+                    entry = s._map_otos[key] = intern(s.data[key:end])
+                    return entry
+
+            raise Exception("Cannot find string entry at 0x%x" % (key))
+
+    def strings(s, offsets):
+
+        """Given a list of offsets return their strings, looked up in bulk"""
+
+        if s.entry is not None:
+            return map(s.__getitem__, offsets)
+
+        (data, strings) = (s.data, [])
+
+        for offset in offsets:
+
+            end = data.find('\x00', offset)
+
+            if offset < 0 or end < 0 or (offset and data[offset - 1] != '\x00'):
+                raise Exception("Cannot find string entry at 0x%x" % (offset))
+
+            strings.append(data[offset:end])
+
+        return strings
 
     def dump(s, io):
 
+        if s.entry is None:
+            s.index()
+
         return io.write('\x00'.join(s.entry) + '\x00')
 
 class StringHelper(object):
@@ -245,10 +313,8 @@ class StringHelper(object):
             
             return False
 
-        clz = s.__class__
-
-        r1 = (attr in clz.__escape__) if '__escape__' in dir(clz) else False
-        r2 = (attr in s._escape_) if '_escape_' in dir(s) else False
+        r1 = attr in getattr(s.__class__, '__escape__', ())
+        r2 = attr in s.__dict__.get('_escape_', ())
 
         return r1 or r2
 
@@ -399,16 +465,49 @@ class Row(StringHelper):
     @classmethod
     def parse(cls, utf, io):
 
-        s = cls(utf)
+        return cls.parseall(utf, io, 1)[0]
 
-        for col in s.utf.cols:
+    @classmethod
+    def parseall(cls, utf, io, count):
 
-            val = col.read(io)
+        """Parse `count' rows at once with the Struct compiled from Columns"""
 
-            # Set value as instance attribute
-            s.__setattr__(col.name, val)
+        (rowstruct, layout) = utf.compile()
 
-        return s
+        data = io.read(rowstruct.size * count)
+
+        if rowstruct.size:
+            values = [rowstruct.unpack_from(data, i) for i in xrange(0, len(data), rowstruct.size)]
+        else:
+            values = [()] * count
+
+        # Regroup values by column, a cell is the tuple of its Column's values
+        columns = zip(*values)
+
+        escape = cls(utf)._escape_
+
+        keys = [ 'utf', '_escape_' ]
+        cells = [ [utf] * count, [escape] * count ]
+
+        for name, start, end, const in layout:
+
+            keys.append('_offset_' + name if name in escape else name)
+
+            if start is None:
+                cells.append([const] * count)
+            else:
+                cells.append(zip(*columns[start:end]))
+
+        rows = []
+
+        for vals in zip(*cells):
+
+            # Set attributes without StringHelper, values are already raw
+            s = object.__new__(cls)
+            object.__setattr__(s, '__dict__', dict(zip(keys, vals)))
+            rows.append(s)
+
+        return rows
 
     def dump(s, io):
 
@@ -419,6 +518,10 @@ class Row(StringHelper):
             else:
                 val = s.__getattr__(col.name)
 
+            # A string set by attribute is stored as a bare offset
+            if tuple != type(val):
+                val = (val, )
+
             col.write(io, val);
 
     __getitem__ = StringHelper.__getattr__
@@ -437,6 +540,8 @@ class UTFTable(StringHelper):
         # New instance of StringTable
         s.string_table = StringTable()
 
+        s.encrypted = False
+
         # Initialize rows and cols list
         s.rows = []
         s.cols = []
@@ -516,8 +621,12 @@ class UTFTable(StringHelper):
 
         io.seek(s.rows_offset)
 
-        while len(s.rows) < s.row_length:
-            s.rows.append(Row.parse(s, io));
+        # Keep the rows region, rows are built from it on first access
+        s.rows_data = io.read(s.string_table_offset - s.rows_offset)
+
+        s._rows = None
+
+        io.seek(s.string_table_offset)
 
         assert io.tell() == s.string_table_offset
 
@@ -525,6 +634,120 @@ class UTFTable(StringHelper):
 
         return s
 
+    @property
+    def rows(s):
+
+        """Rows of the table, a parsed table builds them on first access"""
+
+        if s._rows is None:
+            s._rows = Row.parseall(s, UTFTableIO(StringIO(s.rows_data)), s.row_length)
+
+        return s._rows
+
+    @rows.setter
+    def rows(s, rows):
+
+        s._rows = rows
+
+    def compile(s):
+
+        """
+        Compile Columns into a Struct of one row, return (Struct, layout)
+
+        `layout' is a list of (name, start, end, const) for each Column, values
+        of a per-row Column are unpacked[start:end], otherwise `const'
+        """
+
+        pattern = '>'
+        layout = []
+
+        for col in s.cols:
+
+            if col.be(COLUMN_STORAGE_PERROW):
+                fmt = col.pattern()[1:]
+                start = len(pattern) - 1
+                pattern += fmt
+                layout.append((col.name, start, start + len(fmt), None))
+            else:
+                layout.append((col.name, None, None, col.read(None)))
+
+        rowstruct = Struct(pattern)
+
+        return (rowstruct, layout)
+
+    def columnar(s):
+
+        """
+        Get per-row Columns as a NumPy structured array of the rows region
+
+        The array reflects the table as parsed, a table built in memory is
+        dumped first. String Columns hold offsets, see `strings'.
+        """
+
+        cols = [(c.name, c.datatype) for c in s.cols if c.be(COLUMN_STORAGE_PERROW)]
+
+        if not hasattr(s, 'rows_data'):
+            f = StringIO()
+            io = UTFTableIO(f)
+            for r in s.rows:
+                r.dump(io)
+            return rowarray(cols, f.getvalue(), len(s.rows))
+
+        return rowarray(cols, s.rows_data, s.row_length)
+
+    def strings(s, name, columns=None):
+
+        """Resolve String Column `name' of `columns' to an object array of strings"""
+
+        if columns is None:
+            columns = s.columnar()
+
+        return stringarray(columns[name], s.string_table.strings)
+
+    def column(s, name):
+
+        """
+        Values of Column `name' for every row as a list, strings resolved and
+        None where the Column is missing or empty. Rows are not built when
+        not accessed yet, the rows region is decoded directly
+        """
+
+        cols = [c for c in s.cols if c.name == name]
+
+        if not cols:
+            return [None] * len(s)
+
+        col = cols[0]
+
+        if s._rows is not None:
+            values = [r[name] for r in s._rows]
+            return [(v[0] if len(v) else None) if tuple == type(v) else v for v in values]
+
+        if not col.be(COLUMN_STORAGE_PERROW):
+            value = col.read(None)
+            value = value[0] if len(value) else None
+            if value is not None and col.be(COLUMN_TYPE_STRING):
+                value = s.string(value)
+            return [value] * s.row_length
+
+        if numpy is not None:
+            columns = s.columnar()
+            if col.be(COLUMN_TYPE_STRING):
+                return s.strings(name, columns).tolist()
+            values = columns[name]
+            return (values if values.ndim == 1 else values[:, 0]).tolist()
+
+        (rowstruct, layout) = s.compile()
+
+        start = [start for n, start, end, const in layout if n == name][0]
+        values = [rowstruct.unpack_from(s.rows_data, i)[start]
+                for i in xrange(0, rowstruct.size * s.row_length, rowstruct.size)]
+
+        if col.be(COLUMN_TYPE_STRING):
+            values = s.string_table.strings(values)
+
+        return values
+
     def string(s, v):
 
         if tuple == type(v):
@@ -535,7 +758,7 @@ class UTFTable(StringHelper):
     def __len__(s):
 
         # Return record count
-        return len(s.rows)
+        return s.row_length if s._rows is None else len(s._rows)
 
     def dump(s, io):
 
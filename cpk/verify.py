@@ -0,0 +1,187 @@
+from struct import unpack
+from itertools import izip, imap
+import hashlib
+import os
+
+from fragment import FRAGMENT_CPK
+from crilayla import deflate_crilayla
+from archive import MappedArchive, cell
+
+# Hash of entry content in manifest
+VERIFY_HASH = hashlib.sha1
+
+# Entries handed to a worker at once
+VERIFY_CHUNK = 16
+
+def loadmanifest(f):
+
+    """Read a manifest in `sha1sum' format as {path : hex digest}"""
+
+    manifest = {}
+
+    for line in f:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        (digest, path) = line.split(None, 1)
+        path = path.lstrip('*').replace(os.sep, '/')
+        if path.startswith('./'):
+            path = path[2:]
+        manifest[path] = digest.lower()
+
+    return manifest
+
+def checkentry(archive, entry):
+
+    """Decode an entry, return (problems, hex digest of its content or None)"""
+
+    (file_size, extract_size) = (cell(entry, 'FileSize'), cell(entry, 'ExtractSize'))
+
+    data = archive.readraw(entry)
+
+    if len(data) != file_size:
+        return (['truncated to 0x%x of 0x%x bytes' % (len(data), file_size)], None)
+
+    if data[:8] != 'CRILAYLA':
+        if file_size != extract_size:
+            return (['raw FileSize 0x%x differs from ExtractSize 0x%x' % (file_size, extract_size)], None)
+        return ([], VERIFY_HASH(data).hexdigest())
+
+    if file_size < 0x110:
+        return (['CRILAYLA frame of 0x%x bytes is too short' % file_size], None)
+
+    (_, uncompressed_size, datasize) = unpack('<8sLL', data[:0x10])
+
+    # Same invariants as uncompress asserts
+    problems = []
+
+    if datasize + 0x0100 != file_size - 0x10:
+        problems.append('CRILAYLA data size 0x%x does not fit FileSize 0x%x' % (datasize, file_size))
+
+    if uncompressed_size + 0x0100 != extract_size:
+        problems.append('CRILAYLA size 0x%x does not fit ExtractSize 0x%x' % (uncompressed_size, extract_size))
+
+    if problems:
+        return (problems, None)
+
+    try:
+        out = deflate_crilayla(data[0x10:0x10 + datasize], uncompressed_size)
+    except Exception as e:
+        return (['CRILAYLA data is corrupt (%s)' % e], None)
+
+    if len(out) != uncompressed_size:
+        return (['CRILAYLA data decodes to 0x%x of 0x%x bytes' % (len(out), uncompressed_size)], None)
+
+    digest = VERIFY_HASH(data[0x10 + datasize:])
+    digest.update(out)
+
+    return ([], digest.hexdigest())
+
+workerarchive = None
+
+def initworker(path):
+
+    global workerarchive
+    workerarchive = MappedArchive(open(path, 'rb'))
+
+def verifyworker(entry):
+
+    return checkentry(workerarchive, entry)
+
+class Verifier(object):
+
+    """
+    Integrity check of CPK archive without extracting
+
+    Extents of entries and tables are checked against each other and the
+    archive size, then every entry is decoded by worker processes and its
+    content hashed against `manifest', {path : hex digest}, when given.
+    Only one entry per worker is held in memory at a time.
+    """
+
+    def __init__(s, path, manifest=None, index=False):
+
+        (s.path, s.manifest) = (path, manifest)
+
+        s.archive = MappedArchive(open(path, 'rb'), index)
+
+    def extents(s):
+
+        """Check entries and tables for overlaps and out of bounds, return [(path, problem)]"""
+
+        a = s.archive
+
+        size = os.fstat(a.f.fileno()).st_size
+        contentoffset = cell(a.header, 'ContentOffset')
+
+        extents = [(a.offset(e), cell(e, 'FileSize'), a.path(e)) for e in a.entries]
+        extents += [(fragment.offset, fragment.length + 0x10, '<%s>' % special)
+                for special, fragment in a.fragments.items() if special != FRAGMENT_CPK]
+
+        problems = []
+        (end, last) = (0, None)
+
+        for offset, length, path in sorted(extents):
+            if offset + length > size:
+                problems.append((path, 'ends at 0x%x beyond archive size 0x%x' % (offset + length, size)))
+            if not path.startswith('<') and offset < contentoffset:
+                problems.append((path, 'starts at 0x%x before content at 0x%x' % (offset, contentoffset)))
+            if offset < end:
+                problems.append((path, 'overlaps %s ending at 0x%x' % (last, end)))
+            if offset + length > end:
+                (end, last) = (offset + length, path)
+
+        return problems
+
+    def verify(s, entries=None, jobs=0, feed=None):
+
+        """
+        Check extents and decode `entries' (all by default) with `jobs' worker
+        processes, `feed(path, problems)' is called for each entry in archive
+        order. Return [(path, problem)]
+        """
+
+        a = s.archive
+
+        if entries is None:
+            entries = a.entries
+
+        problems = s.extents()
+
+        if jobs:
+            import multiprocessing
+            pool = multiprocessing.Pool(jobs, initworker, (s.path,))
+            results = pool.imap(verifyworker, entries, VERIFY_CHUNK)
+        else:
+            results = imap(lambda e: checkentry(a, e), entries)
+
+        seen = set()
+
+        for entry, (found, digest) in izip(entries, results):
+            path = a.path(entry)
+            seen.add(path)
+
+            if s.manifest is not None and digest is not None:
+                if not s.manifest.has_key(path):
+                    found.append('not in manifest')
+                elif s.manifest[path] != digest:
+                    found.append('content hash %s differs from manifest %s' % (digest, s.manifest[path]))
+
+            problems.extend((path, problem) for problem in found)
+
+            if feed:
+                feed(path, found)
+
+        if jobs:
+            pool.close()
+            pool.join()
+
+        if s.manifest is not None and entries is a.entries:
+            for path in sorted(set(s.manifest) - seen):
+                problems.append((path, 'in manifest but not in archive'))
+
+        return problems
+
+    def close(s):
+
+        s.archive.close()
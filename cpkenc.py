@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 
 from struct import unpack
-from array import array
 import argparse
 
+from cpk.chiper import crypt as chiper
+
 parser = argparse.ArgumentParser(description='crypt a cpk archive')
 parser.add_argument('input', help='Input cpk file')
 parser.add_argument('output', help='Output cpk file')
@@ -28,13 +29,6 @@ def parseHeader(header):
             size = unpack('<L', header[(i+1)*4: (i+2)*4])
             return (marker, size[0])
 
-def chiper(data):
-    c, m = (0x5f, 0x15)
-    v = array('B', data)
-    for i in xrange(len(v)):
-        v[i] = v[i] ^ c & 0b11111111
-        c = c * m & 0b11111111
-    return v.tostring()
 
 filecount = 0
 
@@ -1,14 +1,87 @@
 #!/usr/bin/env python
 
+from cpk.archive import Archive
+from cpk.packer import Packer
+from cpk.patcher import Patcher
+from cpk.crilayla import COMPRESS_PRESETS
+
 if __name__ == '__main__':
 
     import argparse
+    import os
     from sys import stderr
 
     parser = argparse.ArgumentParser(description='Pack up a cpk archive')
     parser.add_argument('dir', help='Directory with content to pack up')
-    parser.add_argument('-r', '--remake', 
+    parser.add_argument('-r', '--remake',
             dest='cpk',
             help='Make a cpk file with the same XTOC as the cpk file given')
+    parser.add_argument('-u', '--update', dest='reuse', action='store_true',
+            help='With the remake, dir holds changed files only, others are '
+                 'copied as stored in the cpk file given')
+    parser.add_argument('-p', '--patch',
+            dest='patch',
+            help='Patch the cpk file given in place, files in dir are appended '
+                 'to its end and its tables are rewritten, files compressed in '
+                 'the cpk stay compressed, others are compressed only with -c')
+    parser.add_argument('-o', '--output',
+            default='output.cpk', dest='output',
+            help='Output CPK file (default "output.cpk")')
+    parser.add_argument('-c', '--compress',
+            default=None, dest='preset', choices=sorted(COMPRESS_PRESETS),
+            help='Compress files with CRILAYLA when smaller, with the remake '
+                 'files compressed in the cpk given are compressed (default "lazy")')
+    parser.add_argument('-e', '--encrypt', dest='encrypted', action='store_true',
+            help='Encrypt @UTF tables, with the remake follow the cpk given')
+    parser.add_argument('-j', '--jobs',
+            default=0, dest='jobs', type=int,
+            help='Compress files with N worker processes')
     args = parser.parse_args()
 
+    if not os.path.isdir(args.dir):
+        parser.error("`%s' is not a directory" % args.dir)
+
+    if args.reuse and not args.cpk:
+        parser.error('--update requires --remake')
+
+    if args.patch and args.cpk:
+        parser.error('--patch cannot be used with --remake')
+
+    def progress(path, size, stored):
+        progress.files += 1
+        print >>stderr, '(%4d/%4d) %-30s 0x%08x -> 0x%08x' % \
+                (progress.files, progress.total, path, size, stored)
+
+    progress.files = 0
+
+    if args.patch:
+
+        with open(args.patch, 'r+b') as f:
+
+            patcher = Patcher(f, args.dir, args.preset)
+
+            print >>stderr, "Patch %d files from %s..." % (len(patcher.files), args.dir)
+
+            progress.total = len(patcher.files)
+
+            patcher.patch(args.jobs, progress)
+
+        print >>stderr, "Patched %d files to %s" % (len(patcher.files), args.patch)
+
+        exit(0)
+
+    template = Archive(open(args.cpk, 'rb')) if args.cpk else None
+
+    packer = Packer(args.dir, template, args.preset, args.encrypted, reuse=args.reuse)
+
+    print >>stderr, "Pack %d files from %s..." % (len(packer.files), args.dir)
+
+    progress.total = len(packer.files)
+
+    with open(args.output, 'wb') as f:
+        packer.pack(f, args.jobs, progress)
+
+    if template:
+        template.close()
+
+    print >>stderr, "Packed %d files to %s" % (len(packer.files), args.output)
@@ -54,8 +54,9 @@ def identify(header, nofail=False):
         raise Exception('Unable to recognize frame for "%s"' % repr(header));
 
 from cStringIO import StringIO
-from struct import unpack
+from struct import unpack, unpack_from
 from contextlib import closing
+from mmap import mmap, ACCESS_READ
 
 def parseCriHeader(header):
     for i in xrange(4):
@@ -64,63 +65,69 @@ def parseCriHeader(header):
             size = unpack('<L', header[(i+1)*4: (i+2)*4])
             return (marker, size[0])
 
+def readview(f, size):
+    """Read `size' bytes, as a buffer into the mapping if `f' is a mmap"""
+    if isinstance(f, mmap):
+        offset = f.tell()
+        f.seek(min(offset + size, f.size()))
+        return buffer(f, offset, size)
+    return f.read(size)
+
+def readback(f, start):
+    """Read again from `start' to current position"""
+    size = f.tell() - start
+    f.seek(start)
+    return readview(f, size)
+
 def extract_criframe(header, f):
     marker, size = parseCriHeader(header)
-    data = f.read(size)
+    data = readview(f, size)
     if marker.startswith("CRILAYLA"):
-        return [data, f.read(0x100)]
+        return [data, readview(f, 0x100)]
     return [data]
 
 def extract_gim(header, f):
-    with closing(StringIO()) as out:
-        reserved = f.read(0x04)
-        assert reserved == '\x02\x00\x00\x00'
-        out.write(reserved)
-        sizedata = infile.read(0x04)
-        size, = unpack('<L', sizedata)
-        out.write(sizedata)
-        data = f.read(size)
-        out.write(data)
-        return [out.getvalue()]
+    start = f.tell()
+    reserved = f.read(0x04)
+    assert reserved == '\x02\x00\x00\x00'
+    sizedata = f.read(0x04)
+    size, = unpack('<L', sizedata)
+    f.seek(start)
+    return [readview(f, 0x08 + size)]
 
 def extract_1raw(header, f):
-    with closing(StringIO()) as out:
-        while True:
-            data = f.read(0x10)
-            if identify(data, True):
-                break
-            out.write(data)
-        f.seek(-0x10, 1)
-        return [out.getvalue()]
+    start = f.tell()
+    while True:
+        data = f.read(0x10)
+        if identify(data, True):
+            break
+    f.seek(-0x10, 1)
+    return [readback(f, start)]
 
 def extract_80000024(header, f):
-    with closing(StringIO()) as out:
-        while True:
-            tmp = infile.read(0x04)
-            out.write(tmp)
-            if tmp == '\x80\x01\x00\x0E':
-                break;
-        return [out.getvalue()]
+    start = f.tell()
+    while True:
+        tmp = f.read(0x04)
+        if tmp == '\x80\x01\x00\x0E':
+            break;
+    return [readback(f, start)]
 
 def extract_png(header, f):
-    with closing(StringIO()) as out:
-        prvdata = ''
-        while True:
-            data = f.read(0x10)
-            hexdata = data.encode('hex')
-            out.write(data)
-            if (prvdata + hexdata).find('49454e44ae426082') >= 0:
-                break
-            else:
-                prvdata = hexdata
-        return [out.getvalue()]
+    start = f.tell()
+    prvdata = ''
+    while True:
+        data = f.read(0x10)
+        hexdata = data.encode('hex')
+        if (prvdata + hexdata).find('49454e44ae426082') >= 0:
+            break
+        else:
+            prvdata = hexdata
+    return [readback(f, start)]
 
 def extract_generic_from_tablelibrary(header, f):
-    with closing(StringIO()) as out:
-        f.seek(-0x10, 1)
-        row = lib.fromoffset(f.tell()) # lib is a global TableLibrary object, possibly incomplete
-        out.write(f.read(row.ExtractSize[0]))
-        return [out.getvalue()]
+    f.seek(-0x10, 1)
+    row = lib.fromoffset(f.tell()) # lib is a global TableLibrary object, possibly incomplete
+    return [readview(f, row.ExtractSize[0])]
 
 def extract_none(header, f):
     return ['']
@@ -205,17 +212,7 @@ COLUMN_TYPE_2BYTE         = 0x02
 COLUMN_TYPE_1BYTE2        = 0x01
 COLUMN_TYPE_1BYTE         = 0x00
 
-from array import array
-
-def chiper(data):
-    """Chiper for @UTF Table"""
-
-    c, m = (0x5f, 0x15)
-    v = array('B', data)
-    for i in xrange(len(v)):
-        v[i] = v[i] ^ c & 0b11111111
-        c = c * m & 0b11111111
-    return v.tostring()
+from cpk.chiper import crypt as chiper
 
 COLUMN_TYPE_MAP = {
     COLUMN_TYPE_DATA    : '>LL',
@@ -234,7 +231,7 @@ class Field:
 
     def __init__(s, utf, f):
         s.typeid, s.nameoffset = unpack('>BL', f.read(0x05))
-        s.name = utf.getstring(f, s.nameoffset)
+        s.name = utf.getstring(s.nameoffset)
         s.storagetype = s.typeid & COLUMN_STORAGE_MASK
         s.fieldtype = s.typeid & COLUMN_TYPE_MASK
         if s.feature(COLUMN_STORAGE_CONSTANT):
@@ -243,7 +240,7 @@ class Field:
                 raise Exception("Unknown Type 0x%02x" % s.fieldtype)
             col_data = unpack(pattern, f.read(calcsize(pattern)))
             if s.feature(COLUMN_TYPE_STRING):
-                col_data = (utf.getstring(f, col_data[0]), col_data[0])
+                col_data = (utf.getstring(col_data[0]), col_data[0])
             s.data = col_data
 
     def feature(s, typeid):
@@ -252,27 +249,73 @@ class Field:
         else:
             return s.storagetype == typeid or s.fieldtype == typeid or s.typeid == typeid
 
-from struct import calcsize
+from struct import calcsize, Struct
+from cpk.utf import rowarray, stringarray
+
+def compileschema(utf):
+    """Compile per-row columns into one Struct and a plan to slice its values into cells"""
+    pattern = '>'
+    plan = []
+    index = 0
+    for s in utf.columns:
+        if s.feature(COLUMN_STORAGE_CONSTANT):
+            plan.append((COLUMN_STORAGE_CONSTANT, s.data))
+        elif s.feature(COLUMN_STORAGE_ZERO):
+            plan.append((COLUMN_STORAGE_ZERO, ()))
+        elif s.feature(COLUMN_STORAGE_PERROW):
+            fmt = COLUMN_TYPE_MAP[s.fieldtype]
+            if not fmt:
+                raise Exception("Unknown Type 0x%02x" % s.fieldtype)
+            count = len(fmt) - 1
+            plan.append((COLUMN_STORAGE_PERROW, index, index + count, s.feature(COLUMN_TYPE_STRING)))
+            pattern += fmt[1:]
+            index += count
+    return (Struct(pattern), plan)
+
+class Rows(object):
+    """Rows of a @UTF table, each decoded from the rows region on access"""
+
+    def __init__(s, utf, data):
+        (s.utf, s.data) = (utf, data)
+        (s.rowstruct, s.plan) = compileschema(utf)
+        assert s.rowstruct.size == utf.row_width
+        assert len(data) == utf.row_width * utf.row_length
+
+    def __len__(s):
+        return s.utf.row_length
+
+    def __getitem__(s, i):
+        if i < 0:
+            i += len(s)
+        if not 0 <= i < len(s):
+            raise IndexError("row index out of range")
+
+        values = s.rowstruct.unpack_from(s.data, i * s.rowstruct.size) if s.rowstruct.size else ()
 
-def readrow(f, utf):
-    for i in xrange(utf.row_length):
-        start_offset = f.tell()
         row = []
-        for s in utf.columns:
-            if s.feature(COLUMN_STORAGE_CONSTANT):
-                row.append(s.data)
-            elif s.feature(COLUMN_STORAGE_ZERO):
-                row.append(())
-            elif s.feature(COLUMN_STORAGE_PERROW):
-                pattern = COLUMN_TYPE_MAP[s.fieldtype]
-                if not pattern:
-                    raise Exception("Unknown Type 0x%02x" % s.fieldtype)
-                col_data = unpack(pattern, f.read(calcsize(pattern)))
-                if s.feature(COLUMN_TYPE_STRING):
-                    col_data = (utf.getstring(f, col_data[0]), col_data[0])
-                row.append(col_data)
-        assert f.tell() - start_offset == utf.row_width
-        yield row
+        for p in s.plan:
+            if p[0] == COLUMN_STORAGE_PERROW:
+                _, start, end, isstring = p
+                if isstring:
+                    row.append((s.utf.getstring(values[start]), values[start]))
+                else:
+                    row.append(values[start:end])
+            else:
+                row.append(p[1])
+        return row
+
+    def column(s, index):
+        """Cells of column at `index' for every row, without decoding whole rows"""
+        p = s.plan[index]
+        if p[0] != COLUMN_STORAGE_PERROW:
+            return [p[1]] * len(s)
+
+        _, start, end, isstring = p
+        size = s.rowstruct.size
+        cells = [s.rowstruct.unpack_from(s.data, i)[start:end] for i in xrange(0, size * len(s), size)]
+        if isstring:
+            cells = [(s.utf.getstring(c[0]), c[0]) for c in cells]
+        return cells
 
 class AttributeDict(dict): 
     __getattr__ = dict.__getitem__
@@ -282,21 +325,20 @@ class UTF:
     """@UTF Table Structure"""
 
     def __init__(s, data):
-        if data.startswith('\x1F\x9E\xF3\xF5'):
+        if data[:4] == '\x1F\x9E\xF3\xF5':
             # If the data is encrypted
             s.data = chiper(data)
             s.encrypted = True
         else:
             s.data = data
 
-        with closing(StringIO(s.data)) as f:
-            (
-                    s.marker, 
-                    s.table_size, 
-            ) = unpack('>4sL', f.read(0x08))
-            assert s.marker == '@UTF'
-            s.table_content = f.read(s.table_size)
-            assert len(s.table_content) == s.table_size
+        (
+                s.marker, 
+                s.table_size, 
+        ) = unpack_from('>4sL', s.data)
+        assert s.marker == '@UTF'
+        s.table_content = buffer(s.data, 0x08, s.table_size)
+        assert len(s.table_content) == s.table_size
 
         with closing(StringIO(s.table_content)) as f:
             (
@@ -309,9 +351,14 @@ class UTF:
                     s.row_length
             ) = unpack('>LLLLHHL', f.read(0x18))
 
+            # String Table
+
+            s.string_table = str(buffer(s.table_content, s.string_table_offset))
+            s.strings = {}
+
             # Table Name
 
-            s.name = s.getstring(f, s.table_name_string)
+            s.name = s.getstring(s.table_name_string)
 
             # Schema
 
@@ -322,7 +369,7 @@ class UTF:
             assert f.tell() == s.rows_offset
 
             f.seek(s.rows_offset, 0)
-            s.rows = s.__readrows(f)
+            s.rows = Rows(s, f.read(s.row_width * s.row_length))
 
             assert f.tell() == s.string_table_offset
 
@@ -337,23 +384,28 @@ class UTF:
             schema.append(field)
         return schema
 
-    def __readrows(s, f):
-        rows = []
-        for row in readrow(f, s):
-            rows.append(row)
-        return rows
-
-    def getstring(s, f, string):
-        original = f.tell()
-        f.seek(s.string_table_offset + string, 0)
-        data = ''
-        while True:
-            tmp = f.read(1)
-            if tmp == '\x00':
-                break
-            data += tmp
-        f.seek(original, 0)
-        return data
+    def getstring(s, string):
+        try:
+            return s.strings[string]
+        except KeyError:
+            # Read up to the terminator on first lookup
+            end = s.string_table.find('\x00', string)
+            if end < 0:
+                end = len(s.string_table)
+            data = s.strings[string] = intern(s.string_table[string:end])
+            return data
+
+    def columnar(s):
+        """Per-row columns as a NumPy structured array over the rows region, strings are offsets"""
+        fields = [(c.name, c.fieldtype) for c in s.columns if c.feature(COLUMN_STORAGE_PERROW)]
+        data = buffer(s.table_content, s.rows_offset, s.string_table_offset - s.rows_offset)
+        return rowarray(fields, data, s.row_length)
+
+    def getstrings(s, key, columns = None):
+        """Resolve string column `key' to an object array of strings"""
+        if columns is None:
+            columns = s.columnar()
+        return stringarray(columns[key], lambda offsets: map(s.getstring, offsets))
 
     def value(s, key, row = 0):
         return s.rows[row][s.key2idx[key]]
@@ -388,8 +440,8 @@ class TableLibrary(dict):
         assert utf.schema.ID.feature(COLUMN_TYPE_4BYTE)
 
         s.__OFFSET_ROW_MAP = {}
-        for i in xrange(len(utf.rows)):
-            s.__OFFSET_ROW_MAP[utf.value('FileOffset', i)[0] + s.TOC_BASELINE] = i
+        for i, offset in enumerate(utf.rows.column(utf.key2idx['FileOffset'])):
+            s.__OFFSET_ROW_MAP[offset[0] + s.TOC_BASELINE] = i
 
     def __itoc(s, v):
         utf = v.utf
@@ -428,117 +480,22 @@ class Row:
     def __getattr__(s, key):
         return s.utf.value(key, s.rowid)
 
-from bitarray import bitarray
-
-class CompressedIO:
-
-    def __init__(s, indata):
-        s.b = bitarray()
-        s.b.frombytes(indata[::-1])
-        s.pos = 0
-
-    def read(s, length):
-        data = s.b[s.pos:s.pos+length]
-        s.pos += length
-        return data
-
-    def read01(s, length):
-        return s.read(length).to01()
-
-    def readnum(s, length):
-        return int(s.read01(length), 2)
-
-    def readbyte(s, length = 1):
-        return s.read(length * 8).tobytes()
-
-    def tell(s):
-        return s.pos
-
-    def seek(s, offset, t = 0):
-        if t == 0:
-            s.pos = offset
-        elif t == 1:
-            s.pos += offset
-        elif t == 2:
-            s.pos = len(data) - 1 - offset
-
-    def close(s):
-        s.b = None
-
-def deflate_levels():
-    for v in [2, 3, 5, 8]:
-        yield v
-    while True:
-        yield 8
+from cpk.crilayla import deflate_crilayla, uncompress as uncompress_frame
 
-import time
+from cpk.metrics import Metrics, NullMetrics
+from timeit import default_timer
 
-class DeflateProgressIndicator:
-
-    __INTERVAL = 0.1
-
-    def __init__(s, insize, outsize):
-        s.insize, s.outsize = insize, outsize
-        s.tick = 0
-
-    def feed(s, readptr, writeptr, force=False):
-        if time.clock() - s.tick < DeflateProgressIndicator.__INTERVAL and not force:
-            return
-        print >>stderr, "                      0x%08x / 0x%08x%7.2f%% => 0x%08x / 0x%08x%7.2f%%\r" % (
-                readptr, s.insize, float(readptr) * 100 / s.insize,
-                writeptr, s.outsize, float(writeptr) * 100 / s.outsize),
-        s.tick = time.clock()
-
-from contextlib import nested
+# Instrumentation of a run, replaced by the CLI when asked for
+metrics = NullMetrics()
 
 def __deflate(indata, size):
-    MINIMAL_REFLEN = 3
-    progress = DeflateProgressIndicator(len(indata), size)
-    with nested(closing(CompressedIO(indata)), closing(StringIO())) as (f, out):
-        while True:
-            progress.feed(f.tell() >> 3, out.tell())
-            bit = f.read01(1)
-            if bit == '': 
-                break
-            if int(bit, 2):
-
-                offset = f.readnum(13) + MINIMAL_REFLEN
-                refc = MINIMAL_REFLEN
-
-                for lv in deflate_levels():
-                    bits = f.read(lv)
-                    refc += int(bits.to01(), 2)
-                    if not bits.all():
-                        break
-
-                # DEBUG
-                # curptr = out.tell()
-                # refs = curptr - offset
-                # s = out.getvalue()[refs: min(refs + refc, curptr)]
-                # print >>stderr, 'Control 1 0x%08x(-0x%04x)=0x%08x 0x%04x (0x%04x)%s' % (curptr, offset, refs, refc, len(s), repr(s))
-
-                assert out.tell() >= offset
-
-                while refc > 0:
-                    # read referenced bytes
-                    out.seek(-offset, 1)
-                    ref = out.read(refc)
-                    out.seek(0, 2)
-                    out.write(ref)
-                    refc -= len(ref)
-
-            else:
-                # verbatim byte
-                b = f.readbyte()
-
-                # DEBUG
-                # print >>stderr, 'Control 0 0x%08x %s' % (out.tell(), repr(b))
-
-                out.write(b)
-
-        # Force flush a log
-        progress.feed(f.tell() >> 3, out.tell(), True)
-        return out.getvalue()[:size][::-1]
+    feed = metrics.sampler('decompress', size)
+    with metrics.stage('decompress'):
+        data = deflate_crilayla(indata, size, feed and (lambda readptr, writeptr: feed(writeptr)))
+    if feed:
+        # Force flush a progress
+        feed(size, True)
+    return data
 
 def uncompress(lib, dataframe):
 
@@ -572,7 +529,7 @@ def uncompress(lib, dataframe):
 
 import os, errno
 
-def writefile(root, row, data):
+def openfile(root, row):
     dirname = os.path.join(root, row.DirName[0])
     try:
         os.makedirs(dirname)
@@ -581,8 +538,107 @@ def writefile(root, row, data):
             pass
         else: raise
     
-    with open(os.path.join(dirname, row.FileName[0]), 'wb') as f:
-        return f.write(data[:row.ExtractSize[0]])
+    return open(os.path.join(dirname, row.FileName[0]), 'wb')
+
+def writefile(root, row, data):
+    with metrics.stage('write'), openfile(root, row) as f:
+        return f.write(buffer(data, 0, row.ExtractSize[0]))
+
+def copyfile(root, row, f, offset):
+    """Copy a raw file at `offset' of archive file `f' by kernel if possible, position of `f' is kept"""
+    with metrics.stage('write'), openfile(root, row) as out:
+        position = f.tell()
+        try:
+            return copyrange(f, out, offset, row.ExtractSize[0])
+        finally:
+            f.seek(position)
+
+#####################
+# Parallel Fragment #
+#####################
+
+from cpk.archive import Archive, MappedArchive, cell
+from cpk.fragment import Fragment
+from cpk.utf import UTFTable
+from cpk.selector import Selector
+from cpk.transfer import copyrange
+from cpk.verify import Verifier, loadmanifest
+
+def tableframes(archive):
+    """Wrap tables read by `archive' as DataFrame"""
+
+    for typename in [FRAME_CPK, FRAME_TOC, FRAME_ITOC, FRAME_ETOC]:
+        if not archive.fragments.has_key(typename):
+            continue
+        fragment = archive.fragments[typename]
+        frame = DataFrame(fragment.offset, typename, None, [fragment.data])
+        with metrics.stage('parse'):
+            frame.utf = UTF(frame.data[0])
+        yield frame
+
+def entries(archive, selector=None):
+    """List files in TOC as (offset, dirname, filename, filesize, extractsize) in archive order"""
+
+    selected = selector.select(archive) if selector else archive
+
+    return [(archive.offset(e), e.DirName or '', e.FileName, e.FileSize, e.ExtractSize)
+            for e in selected]
+
+def tocfollows(f):
+    """Whether TOC of archive follows its content, as left by an in-place patch"""
+
+    header = UTFTable.parse(StringIO(Fragment.special(f, 0).data)).rows[0]
+    f.seek(0)
+
+    return cell(header, 'TocOffset') > cell(header, 'ContentOffset')
+
+workerfile = None
+workermap = None
+
+def initworker(path, mapped, timed=False):
+    global workerfile, workermap, metrics
+    workerfile = open(path, 'rb')
+    if mapped:
+        workermap = mmap(workerfile.fileno(), 0, access=ACCESS_READ)
+    if timed:
+        # Stages of a worker process are timed apart and sent back with results
+        metrics = Metrics()
+
+def extractworker(task):
+    """Extract one TOC entry in a worker process, return (seconds taken, {stage : seconds added})"""
+
+    timers = dict(metrics.timers)
+    start = default_timer()
+    extractentry(*task)
+    seconds = default_timer() - start
+    return (seconds, dict((name, t - timers.get(name, 0)) for name, t in metrics.timers.items()))
+
+def extractentry(root, entry):
+    """Extract one TOC entry under `root'"""
+
+    (offset, dirname, filename, filesize, extractsize) = entry
+
+    row = AttributeDict(DirName=(dirname,), FileName=(filename,), ExtractSize=(extractsize,))
+
+    if not filesize:
+        # Empty file shares its offset with the next file, nothing is read
+        return writefile(root, row, '')
+
+    f = workermap or workerfile
+    f.seek(offset)
+
+    # A CRILAYLA frame has at least its header, a shorter file is raw
+    if filesize < 0x10 or f.read(min(8, filesize)) != FRAME_CRILAYLA:
+        # Raw file is copied by kernel from archive to output
+        assert filesize == extractsize
+        return copyfile(root, row, workerfile, offset)
+
+    f.seek(offset)
+    data = readview(f, filesize)
+    with metrics.stage('decompress'):
+        data = uncompress_frame(data, None, extractsize, filesize)
+
+    return writefile(root, row, data)
 
 ################
 # CLI Fragment #
@@ -608,7 +664,62 @@ if __name__ == '__main__':
     def write_line(strline):
         print strline * LINE_WIDTH
 
+    def printtable(frame):
+
+        table = frame.utf
+
+        # print schema(columns)
+
+        write_line('=')
+        print "Schema %s (%s)" % (table.name, frame.typename)
+        write_line('-')
+        for field in table.columns:
+            print "\t%02x %30s(0x%08x)" % (field.typeid, field.name, field.nameoffset)
+            if field.feature(COLUMN_STORAGE_CONSTANT):
+                print ("\t > " + COLUMN_TYPE_PRINT[field.fieldtype]) % (field.data)
+        write_line('-')
+
+        # for CPK header, print in K-V style
+
+        if frame.typename in [FRAME_CPK]:
+            # Vertical Table
+
+            for i in xrange(len(table.columns)):
+                if table.columns[i].feature([
+                    COLUMN_STORAGE_ZERO, 
+                    COLUMN_STORAGE_CONSTANT,
+                    ]):
+                    continue
+                print '%30s' % table.columns[i].name,
+                print (COLUMN_TYPE_PRINT[table.columns[i].fieldtype] % table.rows[0][i]).strip()
+        else:
+            # Horizontal Table
+
+            # print table header
+            for i in xrange(len(table.columns)):
+                if table.columns[i].feature([
+                    COLUMN_STORAGE_ZERO, 
+                    COLUMN_STORAGE_CONSTANT,
+                    ]):
+                    continue
+                print '| ' + table.columns[i].name,
+            print '|'
+
+            # print table rows
+            for row in table.rows:
+                for i in xrange(len(table.columns)):
+                    if table.columns[i].feature([
+                        COLUMN_STORAGE_ZERO, 
+                        COLUMN_STORAGE_CONSTANT,
+                        ]):
+                        continue
+                    print COLUMN_TYPE_PRINT[table.columns[i].fieldtype] % row[i],
+                print
+
+        write_line('=')
+
     import argparse
+    import json
     from sys import stderr
 
     parser = argparse.ArgumentParser(description='unpack a cpk archive')
@@ -620,9 +731,65 @@ if __name__ == '__main__':
             default=0, dest='skip', type=int,
             help='Skip previous N files')
     parser.add_argument('--extract-unknown', dest='do_extract_as_raw', help='Extract frames not matching any filetype based on TOC', action='store_true')
+    parser.add_argument('--no-mmap', dest='mmap', action='store_false',
+            help='Read input with file IO instead of memory mapping')
+    parser.add_argument('-l', '--list', dest='list', action='store_true',
+            help='List files based on TOC without extracting')
+    parser.add_argument('-j', '--jobs',
+            default=0, dest='jobs', type=int,
+            help='Extract files based on TOC with N worker processes')
+    parser.add_argument('--no-index', dest='index', action='store_false',
+            help='Do not keep TOC in a sidecar index next to input for -l and -j')
+    parser.add_argument('-i', '--include', 
+            default=[], dest='include', action='append', metavar='RULE',
+            help='Extract only files matching RULE based on TOC, a path glob, '
+                 're:REGEX, id:N[-M][,...] (TOC ID) or index:N[-M][,...] (ITOC TocIndex)')
+    parser.add_argument('-x', '--exclude', 
+            default=[], dest='exclude', action='append', metavar='RULE',
+            help='Do not extract files matching RULE, see --include')
+    parser.add_argument('--verify', dest='verify', action='store_true',
+            help='Check TOC extents and decode files based on TOC without extracting, '
+                 'with all cores unless -j is given')
+    parser.add_argument('--manifest', dest='manifest', metavar='FILE',
+            help='With --verify, compare content of files with FILE in sha1sum format')
+    parser.add_argument('-q', '--quiet', dest='quiet', action='store_true',
+            help='Do not print progress of frames and files to stderr')
+    parser.add_argument('--trace', dest='trace', metavar='FILE',
+            help='Write a JSON line of offset, sizes and seconds taken per file to FILE')
+    parser.add_argument('--stats', dest='stats', action='store_true',
+            help='Print time taken by each stage and counters as JSON to stderr at last')
     args = parser.parse_args()
 
-    infile = open(args.input, 'rb')
+    def progress(stage, done, total):
+        print >>stderr, "%-10s 0x%010x / 0x%010x%7.2f%%\r" % \
+                (stage, done, total, float(done) * 100 / max(total, 1)),
+
+    tracefile = open(args.trace, 'w') if args.trace else None
+
+    if args.stats or tracefile or not args.quiet:
+        metrics = Metrics(tracefile, None if args.quiet else progress)
+
+    def extracted(path, offset, filesize, extractsize, seconds):
+        metrics.count('files')
+        metrics.count('stored', filesize)
+        metrics.count('extracted', extractsize)
+        metrics.record(path=path, offset=offset, stored=filesize, size=extractsize, seconds=seconds)
+
+    def finish():
+        if args.stats:
+            print >>stderr, json.dumps(metrics.summary(), indent=2, sort_keys=True)
+        if tracefile:
+            tracefile.close()
+
+    try:
+        selector = Selector(args.include, args.exclude)
+    except ValueError as e:
+        parser.error(e)
+
+    rawfile = open(args.input, 'rb')
+
+    # Frames are sliced from the mapping without copy
+    infile = mmap(rawfile.fileno(), 0, access=ACCESS_READ) if args.mmap else rawfile
 
     print >>stderr, "Read %s..." % args.input
 
@@ -636,14 +803,124 @@ if __name__ == '__main__':
     files = 0
 
     lib = TableLibrary()
-    
-    for frame in readframe(infile):
+
+    if args.list:
+
+        archive = MappedArchive(rawfile, args.index) if args.mmap else Archive(rawfile, args.index)
+
+        for offset, dirname, filename, filesize, extractsize in entries(archive, selector):
+            print '0x%010X 0x%08x 0x%08x %s' % \
+                    (offset, filesize, extractsize, os.path.join(dirname, filename))
+
+        infile.close();
+
+        exit(0);
+
+    if args.verify:
+
+        import multiprocessing
+
+        manifest = loadmanifest(open(args.manifest)) if args.manifest else None
+
+        try:
+            verifier = Verifier(args.input, manifest, args.index)
+        except Exception as e:
+            print >>stderr, "BAD %s: tables are unreadable (%s)" % (args.input, e)
+            exit(1);
+
+        jobs = args.jobs or multiprocessing.cpu_count()
+
+        selected = selector.select(verifier.archive) if selector else None
+
+        def verified(path, found):
+            verified.files += 1
+            if not args.quiet:
+                print >>stderr, '(%4d/%4d) %-30s %s' % \
+                        (verified.files, verified.total, path, 'BAD' if found else 'OK')
+
+        verified.files = 0
+        verified.total = len(selected if selected is not None else verifier.archive)
+
+        problems = verifier.verify(selected, jobs, verified)
+
+        print >>stderr, '=' * LINE_WIDTH
+
+        for path, problem in problems:
+            print >>stderr, 'BAD %s: %s' % (path, problem)
+
+        print >>stderr, "Verified %d Files with %d Jobs, %d Problems" % (verified.files, jobs, len(problems))
+
+        verifier.close()
+
+        infile.close();
+
+        exit(1 if problems else 0);
+
+    # Scanning frames needs TOC ahead of content
+    if not args.jobs and not selector and tocfollows(rawfile):
+        print >>stderr, "TOC follows content, extract based on TOC"
+        selector = Selector(['*'])
+
+    if args.jobs or selector:
+
+        import multiprocessing
+        from itertools import izip, imap
+
+        archive = MappedArchive(rawfile, args.index) if args.mmap else Archive(rawfile, args.index)
+
+        for frame in tableframes(archive):
+            printtable(frame)
+
+        # Only selected files are read, based on TOC
+        tasks = [(args.output, entry) for entry in entries(archive, selector)]
+
+        if args.jobs:
+            pool = multiprocessing.Pool(args.jobs, initworker, (args.input, args.mmap, True))
+            mapper = pool.imap
+        else:
+            initworker(args.input, args.mmap)
+            mapper = imap
+
+        # Results are reported in archive order as soon as available
+        for (_, entry), (seconds, timers) in izip(tasks[args.skip:], mapper(extractworker, tasks[args.skip:])):
+            files += 1
+            (offset, dirname, filename, filesize, extractsize) = entry
+            metrics.add('extract', seconds)
+            if args.jobs:
+                # Stages timed in worker processes, in process they are timed already
+                for stage, t in timers.items():
+                    metrics.add(stage, t)
+            extracted(os.path.join(dirname, filename), offset, filesize, extractsize, seconds)
+            if not args.quiet:
+                print >>stderr, '(%4d/%4d) %-30s 0x%08x -> 0x%08x' % \
+                        (files + args.skip, len(tasks), filename, filesize, extractsize)
+
+        if args.jobs:
+            pool.close()
+            pool.join()
+
+        print >>stderr, '=' * LINE_WIDTH
+        print >>stderr, "Extracted %d of %d Files with %d Jobs" % (files, len(archive), max(args.jobs, 1))
+
+        finish()
+
+        infile.close();
+
+        exit(0);
+
+    # Progress of scanning is sampled, not printed per frame
+    scanned = metrics.sampler('scan', os.fstat(rawfile.fileno()).st_size)
+
+    for frame in metrics.timed('scan', readframe(infile)):
 
         # Statistic Information
         STAT[frame.typename] += 1
         frames += 1
-        print >>stderr, "0x%010X Found Frame %-16s (0x%06X)\r" % \
-                (frame.offset, frame.typename, len(frame.data[0])),
+        metrics.count('frames')
+        if scanned:
+            scanned(frame.offset)
+
+        start = default_timer()
 
         if frame.typename in [FRAME_ZERO, FRAME_COPYRIGHT, FRAME__IGNORED]:
             # With no Data
@@ -652,57 +929,10 @@ if __name__ == '__main__':
             # If frame is the Index Frame
 
             # @UTF Table Format
-            frame.utf = table = UTF(frame.data[0])
-
-            # print schema(columns)
-
-            write_line('=')
-            print "Schema %s (%s)" % (table.name, frame.typename)
-            write_line('-')
-            for field in table.columns:
-                print "\t%02x %30s(0x%08x)" % (field.typeid, field.name, field.nameoffset)
-                if field.feature(COLUMN_STORAGE_CONSTANT):
-                    print ("\t > " + COLUMN_TYPE_PRINT[field.fieldtype]) % (field.data)
-            write_line('-')
-
-            # for CPK header, print in K-V style
+            with metrics.stage('parse'):
+                frame.utf = UTF(frame.data[0])
 
-            if frame.typename in [FRAME_CPK]:
-                # Vertical Table
-
-                for i in xrange(len(table.columns)):
-                    if table.columns[i].feature([
-                        COLUMN_STORAGE_ZERO, 
-                        COLUMN_STORAGE_CONSTANT,
-                        ]):
-                        continue
-                    print '%30s' % table.columns[i].name,
-                    print (COLUMN_TYPE_PRINT[table.columns[i].fieldtype] % table.rows[0][i]).strip()
-            else:
-                # Horizontal Table
-
-                # print table header
-                for i in xrange(len(table.columns)):
-                    if table.columns[i].feature([
-                        COLUMN_STORAGE_ZERO, 
-                        COLUMN_STORAGE_CONSTANT,
-                        ]):
-                        continue
-                    print '| ' + table.columns[i].name,
-                print '|'
-
-                # print table rows
-                for row in table.rows:
-                    for i in xrange(len(table.columns)):
-                        if table.columns[i].feature([
-                            COLUMN_STORAGE_ZERO, 
-                            COLUMN_STORAGE_CONSTANT,
-                            ]):
-                            continue
-                        print COLUMN_TYPE_PRINT[table.columns[i].fieldtype] % row[i],
-                    print
-
-            write_line('=')
+            printtable(frame)
 
             # Register frame to Library
             lib[frame.typename] = frame
@@ -714,17 +944,22 @@ if __name__ == '__main__':
 
             row = lib.fromoffset(frame.offset)
 
-            # DEBUG
-            print >>stderr, '(%4d/%4d) %-30s 0x%08x -> 0x%08x (+0x0100=0x%08x)' % \
-                    (files, lib.FILES, row.FileName[0], row.FileSize[0] - 0x110, row.ExtractSize[0] - 0x100, row.ExtractSize[0]),
+            if not args.quiet:
+                print >>stderr, '(%4d/%4d) %-30s 0x%08x -> 0x%08x (+0x0100=0x%08x)' % \
+                        (files, lib.FILES, row.FileName[0], row.FileSize[0] - 0x110, row.ExtractSize[0] - 0x100, row.ExtractSize[0]),
+
+                if files <= args.skip:
+                    print >>stderr, '\r(%4d/SKIP)' % files
+                else:
+                    print >>stderr
 
             if files <= args.skip:
-                print >>stderr, '\r(%4d/SKIP)' % files
                 continue
 
-            print >>stderr
-
             writefile(args.output, row, uncompress(lib, frame))
+
+            extracted(os.path.join(row.DirName[0], row.FileName[0]), frame.offset,
+                    row.FileSize[0], row.ExtractSize[0], default_timer() - start)
         else:
             # Raw File Frame
 
@@ -734,16 +969,23 @@ if __name__ == '__main__':
 
             assert row.FileSize[0] == row.ExtractSize[0]
 
-            print >>stderr, '(%4d/%4d) %-30s 0x%08x%35s' % \
-                    (files, lib.FILES, row.FileName[0], row.FileSize[0], ''),
+            if not args.quiet:
+                print >>stderr, '(%4d/%4d) %-30s 0x%08x%35s' % \
+                        (files, lib.FILES, row.FileName[0], row.FileSize[0], ''),
+
+                if files <= args.skip:
+                    print >>stderr, '\r(%4d/SKIP)' % files
+                else:
+                    print >>stderr
 
             if files <= args.skip:
-                print >>stderr, '\r(%4d/SKIP)' % files
                 continue
 
-            print >>stderr
+            # Raw data is copied by kernel from archive to output
+            copyfile(args.output, row, rawfile, frame.offset)
 
-            writefile(args.output, row, frame.data[0])
+            extracted(os.path.join(row.DirName[0], row.FileName[0]), frame.offset,
+                    row.FileSize[0], row.ExtractSize[0], default_timer() - start)
 
     print >>stderr, '=' * LINE_WIDTH
     print >>stderr, "Scanner Found %d Frames" % frames
@@ -751,6 +993,8 @@ if __name__ == '__main__':
     for h, k in FRAME_HEADER_MAP + FRAME_EXTRA_TYPES:
         print >>stderr, "%16s : %d" % (k, STAT[k])
 
+    finish()
+
     infile.close();
 
     exit(0);
@@ -1,35 +1,172 @@
 #!/usr/bin/env python
 
-import argparse
-
-parser = argparse.ArgumentParser(description='Scan file to find shift-jis string')
-parser.add_argument('input', help='scenario file')
-args = parser.parse_args()
-
-import struct
-
-data = open(args.input, 'rb').read()
-
-length = len(data)
-
-for i in xrange(length - 2):
-    val = struct.unpack("<h", data[i:i+2])[0]
-    if val < 0:
-        continue
-    if val > length:
-        continue
-    if val % 2 != 0:
-        continue
-    if data[i+val-2:i+val] != '\x00\x00':
-        continue
-    try:
-        strline = data[i+2:i+val-2].decode('shift-jis')
-        for char in strline:
-            if char < "\x1f":
-               strline = ""
-        if len(strline) > 0:
-            print "0x%010X-0x%010X(0x%04X)\t%s\r" % \
-                    (i, i + val, val, strline.encode('utf-8'))
-    except:
-        continue
+import os
+import re
+from array import array
+from itertools import izip, imap
+from sys import byteorder
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Shortest length field of a string printed, 2 bytes of field, text and terminator
+STRING_MIN = 6
+
+# Control characters reject a candidate
+CONTROL = re.compile(u'[\x00-\x1e]')
+
+# Bytes of a file scanned as one task
+CHUNK_SIZE = 4 << 20
+
+# Chunks read past their end by the largest length field, so that strings
+# starting in a chunk are complete
+CHUNK_OVERLAP = 0x7FFF
+
+def candidates(data, count=None):
+
+    """
+    Find (offset, length) of every little-endian 16-bit length field whose
+    length is even, fits in `data' and ends with a '\\x00\\x00' terminator,
+    looking at fields of the first `count' offsets only when given
+    """
+
+    n = len(data)
+
+    if n < 3:
+        return []
+
+    # Offsets of fields looked at
+    m = n - 2 if count is None else min(count, n - 2)
+
+    if numpy is not None:
+        buf = numpy.frombuffer(data, dtype=numpy.uint8)
+
+        # Signed 16-bit field at every offset but the last two
+        val = buf[:m].astype(numpy.int32) | (buf[1:m + 1].astype(numpy.int8).astype(numpy.int32) << 8)
+        offset = numpy.arange(m, dtype=numpy.int64)
+
+        mask = (val >= STRING_MIN) & (val & 1 == 0) & (offset + val <= n)
+        (offset, val) = (offset[mask], val[mask])
+
+        end = offset + val
+        mask = (buf[end - 2] == 0) & (buf[end - 1] == 0)
+
+        return zip(offset[mask].tolist(), val[mask].tolist())
+
+    found = []
+
+    # Fields at even and odd offsets are read as two arrays of words
+    for parity in (0, 1):
+        words = array('h', data[parity:parity + (m + 1 - parity) / 2 * 2])
+        if byteorder == 'big':
+            words.byteswap()
+        found.extend((i, val) for i, val in izip(xrange(parity, m, 2), words)
+                if val >= STRING_MIN and not val & 1 and i + val <= n and
+                data[i + val - 2:i + val] == '\x00\x00')
+
+    found.sort()
+
+    return found
+
+def strings(data, count=None):
+
+    """Find (offset, length, text) of every shift-jis string in `data', see `candidates'"""
+
+    for i, val in candidates(data, count):
+        try:
+            strline = data[i + 2:i + val - 2].decode('shift-jis')
+        except UnicodeDecodeError:
+            continue
+        if CONTROL.search(strline):
+            continue
+        yield (i, val, strline)
+
+def formatline(i, val, strline):
+
+    return "0x%010X-0x%010X(0x%04X)\t%s\r" % (i, i + val, val, strline.encode('utf-8'))
+
+def chunks(path, size=CHUNK_SIZE):
+
+    """Split file at `path' to tasks of (path, start, end)"""
+
+    length = os.path.getsize(path)
+
+    return [(path, start, min(start + size, length)) for start in xrange(0, max(length, 1), size)]
+
+def scanchunk(task):
+
+    """Find strings starting in chunk (path, start, end), as output lines in offset order"""
+
+    (path, start, end) = task
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start + CHUNK_OVERLAP)
+
+    # A string starting in the overlap belongs to the next chunk
+    return [formatline(start + i, val, strline) for i, val, strline in strings(data, end - start)]
+
+if __name__ == '__main__':
+
+    import argparse
+    from sys import stdout
+
+    parser = argparse.ArgumentParser(description='Scan file to find shift-jis string')
+    parser.add_argument('input', nargs='+', help='scenario file')
+    parser.add_argument('-o', '--output-dir', dest='output',
+            help='Write strings of each scenario file to DIR/<file name>.txt, '
+                 'the file name keeps directories below the common directory '
+                 'of all files, required with more than one file')
+    parser.add_argument('-j', '--jobs',
+            default=0, dest='jobs', type=int,
+            help='Scan chunks of files with N worker processes')
+    parser.add_argument('--chunk-size',
+            default=CHUNK_SIZE, dest='chunk', type=int,
+            help='Bytes of a file scanned as one task (default %d)' % CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if len(args.input) > 1 and not args.output:
+        parser.error('more than one file requires --output-dir')
+
+    # Files of the same name in different directories get their own output
+    paths = map(os.path.abspath, args.input)
+    common = os.path.dirname(os.path.commonprefix(paths))
+    names = [os.path.relpath(path, common) + '.txt' for path in paths]
+
+    if len(set(names)) < len(names):
+        parser.error('a scenario file is given more than once')
+
+    tasks = [chunks(path, args.chunk) for path in args.input]
+
+    if args.jobs:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.jobs)
+        mapper = pool.imap
+    else:
+        mapper = imap
+
+    # Chunks of every file share the pool, results come back in order
+    results = mapper(scanchunk, [task for chunked in tasks for task in chunked])
+
+    for name, chunked in zip(names, tasks):
+
+        if args.output:
+            name = os.path.join(args.output, name)
+            if not os.path.isdir(os.path.dirname(name)):
+                os.makedirs(os.path.dirname(name))
+            out = open(name, 'wb')
+        else:
+            out = stdout
+
+        for _ in chunked:
+            for line in next(results):
+                print >>out, line
+
+        if args.output:
+            out.close()
+
+    if args.jobs:
+        pool.close()
+        pool.join()
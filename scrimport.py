@@ -4,7 +4,7 @@ import argparse
 
 parser = argparse.ArgumentParser(description='Plant text back to original file')
 parser.add_argument('source', help='original scenario file')
-parser.add_argument('text', help='text file with tags')
+parser.add_argument('text', nargs='+', help='text files with tags, clips of one file are merged')
 parser.add_argument('-o', '--output', default='out.bin',
         help='output destination')
 parser.add_argument('-c', '--codefile', help='code file')
@@ -13,86 +13,239 @@ args = parser.parse_args()
 
 import struct
 import re
-
-src = open(args.source, 'rb').read()
+import heapq
+import os
+import shutil
+from mmap import mmap
 
 p = re.compile(r"(0x[0-9A-Fa-f]{10})-(0x[0-9A-Fa-f]{10})\((0x[0-9A-Fa-f]{4})\)\t(.*)$")
 
 def unpack_line(line):
     return tuple(filter(None, p.split(line)))
 
-raw = map(lambda (x): x.strip('\r\n'), open(args.text, 'rb').read().decode('utf-8-sig').split('\n'))
-txt = sorted(filter(lambda (x): not x.startswith('#') and not len(x) == 0, raw))
+def readclip(path, quiet=False):
+    """Read tagged lines of a text file as (start, end, line, path, line number), `quiet' skips bad lines silently"""
+    with open(path, 'rb') as f:
+        last = None
+        for n, line in enumerate(f):
+            line = line.decode('utf-8-sig' if n == 0 else 'utf-8').strip('\r\n')
+            if line.startswith('#') or len(line) == 0:
+                continue
+            try:
+                (start, end, length, text) = unpack_line(line)
+            except Exception as e:
+                if quiet:
+                    continue
+                print '[ERROR] Reading %s line %d: ' % (path, n + 1), e
+                print '[ERROR] Rawdata: ', (line,)
+                print '[ERROR] Matches: ', unpack_line(line)
+                continue
+            key = (int(start, 0), int(end, 0))
+            # Clips are merged as sorted streams
+            if last is not None and key < last:
+                raise Exception('%s line %d is out of order, clips must be sorted by offset' % (path, n + 1))
+            last = key
+            yield key + (line, path, n + 1)
+
+# Clips are checked to be sorted before the output is touched, in-place
+# mode would otherwise leave the output partly patched
+for path in args.text:
+    for _ in readclip(path, True):
+        pass
+
+# Lines of all clips in order of offset, only one line per clip is held
+txt = heapq.merge(*map(readclip, args.text))
+
+class CodeTable(object):
+
+    """
+    Code table compiled for encoding
+
+    Single characters are encoded in one pass by unicode.translate, codes
+    being held as latin-1 text. Once a code of several characters is given,
+    a trie of characters is walked for the longest match at each position.
+    """
+
+    def __init__(s, codes):
+
+        # {ordinal : code as latin-1 text} of single characters
+        s.table = {}
+
+        # {character : [code or None, children]}
+        s.trie = {}
+
+        s.multiple = False
+
+        for characters, code in codes:
+            if len(characters) == 1:
+                s.table[ord(characters)] = code.decode('latin-1')
+            else:
+                s.multiple = True
+            children = s.trie
+            for character in characters[:-1]:
+                children = children.setdefault(character, [None, {}])[1]
+            children.setdefault(characters[-1], [None, {}])[0] = code
+
+    @classmethod
+    def load(cls, f):
+
+        """Read lines of `hex code=characters' up to the first empty line"""
+
+        codes = []
+
+        for n, line in enumerate(iter(f.readline, '')):
+            line = line.strip('\r\n')
+            if not len(line):
+                break
+            code, characters = line.decode('utf-8').split('=', 1)
+            if not len(characters):
+                raise Exception('%s line %d: code %s has no characters' % (getattr(f, 'name', 'code file'), n + 1, code))
+            codes.append((characters, code.decode('hex')))
+
+        return cls(codes)
+
+    def encode(s, text):
+
+        """Encode `text', return (data, missing characters), data is None if any missing"""
+
+        if not s.multiple:
+            missing = sorted(c for c in set(text) if ord(c) not in s.table)
+            if missing:
+                return (None, missing)
+            return (text.translate(s.table).encode('latin-1'), [])
+
+        out = bytearray()
+        missing = []
+
+        (i, n) = (0, len(text))
+
+        while i < n:
+            (end, code) = (i, None)
+            children = s.trie
+            j = i
+            while j < n:
+                node = children.get(text[j])
+                if node is None:
+                    break
+                j += 1
+                if node[0] is not None:
+                    (end, code) = (j, node[0])
+                children = node[1]
+            if code is None:
+                if text[i] not in missing:
+                    missing.append(text[i])
+                i += 1
+            else:
+                out += code
+                i = end
+
+        if missing:
+            return (None, sorted(missing))
 
-codetable = {}
+        return (str(out), [])
+
+codetable = None
 
 if args.codefile:
     with open(args.codefile, 'r') as codefile:
-        while True:
-            line = codefile.readline().strip('\r\n')
-            if len(line):
-                code, character = line.decode('utf-8').split('=', 1)
-                codetable[character] = code.decode('hex')
-            else:
-                break
+        codetable = CodeTable.load(codefile)
+
+# Characters missing in code table over all lines
+missed = set()
 
 def encode(text, line):
-    if args.codefile:
-        data = ''
-        for character in text:
-            if codetable.has_key(character):
-                data += codetable[character]
-            else:
-                print '[WARNING] Missing character', character.encode('utf-8'), 'at', line
-                return None
+    if codetable is not None:
+        data, missing = codetable.encode(text)
+        if missing:
+            print '[WARNING] Missing characters', ' '.join(missing).encode('utf-8'), 'at', line.encode('utf-8')
+            missed.update(missing)
         return data
     else:
         return text.encode('shift-jis')
 
-with open(args.output, 'wb') as output:
-
+def lines():
+    """Encoded lines as (start, end, length field, data), duplicate lines dropped"""
     srcptr = 0
-
-    for line in txt:
-        try:
-            (start, end, length, text) = unpack_line(line)
-        except Exception as e:
-            print '[ERROR] Reading line %d: ' % (raw.index(line) + 1), e
-            print '[ERROR] Rawdata: ', (line,)
-            print '[ERROR] Matches: ', unpack_line(line)
+    for start, end, line, _, _ in txt:
+        (_, _, length, text) = unpack_line(line)
+        data = encode(text, line)
+        if not data:
+            print '[WARNING] Skipped 0x%x-0x%x' % (start, end)
             continue
+        # handle duplicate lines
+        if srcptr == end:
+            continue
+        assert srcptr <= start
+        srcptr = end
+        yield (start, end, int(length, 0), data, line)
 
-        encoded = encode(text, line)
+# Lines cut to fit their slot as (overflow bytes, start, data length, slot length)
+overflows = []
 
-        if not encoded:
-            print '[WARNING] Skipped 0x%s-0x%s' % (start, end)
-            continue
+# Lines listed in overflow summary
+OVERFLOW_SHOWN = 10
+
+if args.inplace:
+
+    # Slots keep their length, so only their pages of the output are written
+    if not os.path.exists(args.output) or not os.path.samefile(args.source, args.output):
+        shutil.copyfile(args.source, args.output)
 
-        data = encoded
+    with open(args.output, 'r+b') as output:
 
-        if args.inplace:
-            text_length = int(length, 0) - 4
+        # An empty file cannot be mapped, nor has it any slot to patch
+        if not os.fstat(output.fileno()).st_size:
+            raise Exception('%s is empty, there is no slot to patch in place' % args.output)
+
+        out = mmap(output.fileno(), 0)
+
+        written = 0
+
+        for start, end, length, data, line in lines():
+            text_length = length - 4
             if len(data) > text_length:
-                print '[EXCCEED] %4d/%-4d :: %s' % (len(data), text_length, line.encode('utf-8'))
+                overflows.append((len(data) - text_length, start, len(data), text_length))
                 data = data[:text_length]
             # append tail padding
             if len(data) < text_length:
                 data += '\x00' * (text_length - len(data))
             assert len(data) == text_length
 
-        # handle duplicate lines
-        if srcptr == int(end, 0):
-            continue
+            if start + length > len(out):
+                raise Exception('Slot 0x%x-0x%x is beyond end of %s' % (start, start + length, args.output))
+
+            out[start:start + length] = struct.pack("<h", length) + data + '\x00\x00'
+            written += 1
+
+        out.flush()
+        out.close()
+
+    if overflows:
+        overflows.sort(reverse=True)
+        print '[EXCCEED] %d of %d lines cut to fit their slot, %d bytes in total' % \
+                (len(overflows), written, sum(o[0] for o in overflows))
+        for overflow, start, data_length, text_length in overflows[:OVERFLOW_SHOWN]:
+            print '[EXCCEED] 0x%010X %4d/%-4d +%d' % (start, data_length, text_length, overflow)
+
+else:
+
+    src = open(args.source, 'rb').read()
+
+    with open(args.output, 'wb') as output:
+
+        srcptr = 0
 
-        assert srcptr <= int(start, 0)
+        for start, end, length, data, line in lines():
+            output.write(src[srcptr:start])
+            output.write(struct.pack("<h", len(data) + 4))
+            output.write(data)
+            output.write('\x00\x00')
 
-        output.write(src[srcptr:int(start, 0)])
-        output.write(struct.pack("<h", len(data) + 4))
-        output.write(data)
-        output.write('\x00\x00')
+            srcptr = end
 
-        srcptr = int(end, 0)
+        output.write(src[srcptr:])
 
-    output.write(src[srcptr:])
+if missed:
+    print '[WARNING] Missing %d characters in code table:' % len(missed), ' '.join(sorted(missed)).encode('utf-8')
 
 exit(0)
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from cpk.packer import Packer
+
+class TocExtractTest(unittest.TestCase):
+
+    """Extraction based on TOC of an archive made by the packer"""
+
+    def setUp(s):
+
+        s.tmp = tempfile.mkdtemp()
+
+        s.files = {
+            'a/empty.bin'   : '',
+            'a/text.bin'    : 'alpha beta gamma delta ' * 200,
+        }
+
+        s.root = os.path.join(s.tmp, 'in')
+
+        for path, data in s.files.items():
+            local = os.path.join(s.root, path)
+            if not os.path.isdir(os.path.dirname(local)):
+                os.makedirs(os.path.dirname(local))
+            with open(local, 'wb') as f:
+                f.write(data)
+
+        s.archive = os.path.join(s.tmp, 'test.cpk')
+
+        # Empty file gets the offset of the compressed file after it
+        with open(s.archive, 'wb') as f:
+            Packer(s.root, preset='greedy').pack(f)
+
+    def tearDown(s):
+
+        shutil.rmtree(s.tmp)
+
+    def unpack(s, *options):
+
+        output = os.path.join(s.tmp, 'out')
+        shutil.rmtree(output, True)
+
+        process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'cpkunpack.py'),
+                s.archive, '-o', output, '--no-index', '-q'] + list(options),
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (out, err) = process.communicate()
+
+        s.assertEqual(process.returncode, 0, err)
+
+        for path, data in s.files.items():
+            with open(os.path.join(output, path), 'rb') as f:
+                s.assertEqual(f.read(), data, path)
+
+        return (out, err)
+
+    def test_empty_before_compressed_jobs(s):
+
+        s.unpack('-j', '2')
+
+    def test_empty_before_compressed_selected(s):
+
+        s.unpack('-i', 'a/*')
+
+    def test_stats_of_jobs(s):
+
+        (out, err) = s.unpack('-j', '2', '--stats')
+
+        timers = json.loads(err[err.index('{'):])['timers']
+
+        for stage in ['parse', 'decompress', 'write', 'extract']:
+            s.assertIn(stage, timers)
+
+if __name__ == '__main__':
+    unittest.main()
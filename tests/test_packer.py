@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from cpk.archive import Archive, cell
+from cpk.fragment import FRAGMENT_ETOC
+from cpk.packer import Packer, newrow
+from cpk.patcher import Patcher
+
+class RemakeTest(unittest.TestCase):
+
+    """Remake of an archive with the tables of a template"""
+
+    def setUp(s):
+
+        s.tmp = tempfile.mkdtemp()
+        s.root = os.path.join(s.tmp, 'in')
+
+        s.write('a/one.bin', 'one')
+        s.write('b/two.bin', 'two')
+
+        s.template = os.path.join(s.tmp, 'template.cpk')
+
+        with open(s.template, 'wb') as f:
+            Packer(s.root).pack(f)
+
+        # Terminator row past the files, as found in ETOC of archives
+        with open(s.template, 'r+b') as f:
+            patcher = Patcher(f, os.path.join(s.tmp, 'none'))
+            newrow(patcher.archive.table(FRAGMENT_ETOC), { 'LocalDir' : '<NULL>' })
+            patcher.patch()
+
+    def tearDown(s):
+
+        shutil.rmtree(s.tmp)
+
+    def write(s, path, data):
+
+        local = os.path.join(s.root, path)
+
+        if not os.path.isdir(os.path.dirname(local)):
+            os.makedirs(os.path.dirname(local))
+
+        with open(local, 'wb') as f:
+            f.write(data)
+
+    def remake(s):
+
+        output = os.path.join(s.tmp, 'out.cpk')
+
+        with open(s.template, 'rb') as f, open(output, 'wb') as out:
+            Packer(s.root, Archive(f)).pack(out)
+
+        with open(output, 'rb') as f:
+            a = Archive(f)
+            return (len(a), a.table(FRAGMENT_ETOC).rows)
+
+    def test_terminator_stays_last(s):
+
+        s.assertEqual(s.remake()[0] + 1, len(s.remake()[1]))
+
+        s.write('c/three.bin', 'three')
+
+        (files, rows) = s.remake()
+
+        s.assertEqual(files + 1, len(rows))
+        s.assertEqual([cell(r, 'LocalDir') for r in rows], ['a', 'b', 'c', '<NULL>'])
+        s.assertEqual(cell(rows[-1], 'UpdateDateTime'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
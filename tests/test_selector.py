@@ -0,0 +1,23 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpk.selector import Selector, numbers
+
+class SelectorTest(unittest.TestCase):
+
+    def test_numbers(s):
+
+        s.assertEqual(numbers('1,4,0x10-0x12'), set([1, 4, 16, 17, 18]))
+
+    def test_malformed_rules(s):
+
+        for spec in ['id:5-', 'index:-', 'id:a', 'id:', 'id:9-3', 're:[']:
+            with s.assertRaises(ValueError) as raised:
+                Selector([spec])
+            s.assertIn(spec, str(raised.exception))
+
+if __name__ == '__main__':
+    unittest.main()